@@ -1,168 +1,236 @@
 import numpy as np
 import pandas as pd
-from scipy import stats
-import warnings
-import pm4py
-from tqdm import tqdm
 import json
-from pm4py.objects.log.importer.xes import importer as xes_importer
-
-possible_distributions = [
-    'fixed',
-    'normal',
-    'exponential',
-    'uniform',
-    'triangular',
-    'lognormal',
-    'gamma'
-]
+from array import array
+from miner_common.event_log import as_event_table, concat_event_tables, iter_event_tables, CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE, TIMESTAMP
+from miner_common.fitting import best_fit_distribution, DEFAULT_SEED
+from miner_common.parallel import fit_samples
+from miner_common.sessions import session_horizon
+from miner_common.sketch import SampleStats
 
 def n_to_weekday(i):
     weekday_labels = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     return dict(zip(range(7), weekday_labels))[i]
 
-def find_best_fit_distribution(observed_values, N=None, remove_outliers=False):
-    if remove_outliers:
-        q1 = np.percentile(observed_values, 25)
-        q3 = np.percentile(observed_values, 75)
-        iqr = q3 - q1
-        lower_limit = q1 - 1.5 * iqr
-        upper_limit = q3 + 1.5 * iqr
-        observed_values = observed_values[(observed_values >= lower_limit) & (observed_values <= upper_limit)]
-    
-    if not N:
-        N = len(observed_values)
-
-    generated_values = dict()
-    distr_params = {d: dict() for d in possible_distributions}
-
-    if np.min(observed_values) == np.max(observed_values):
-        return 'fixed', {'value': np.mean(observed_values)}
-
-    for distr_name in possible_distributions:
-        try:
-            if distr_name == 'fixed':
-                distr_params[distr_name] = {'value': np.mean(observed_values)}
-                generated_values[distr_name] = np.array([distr_params[distr_name]['value']] * N)
-            elif distr_name == 'normal':
-                dist = stats.norm
-                loc, scale = dist.fit(observed_values)
-                q75, q25 = np.percentile(observed_values, [75, 25])
-                iqr = q75 - q25
-                distr_params[distr_name] = {'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'exponential':
-                dist = stats.expon
-                loc, scale = dist.fit(observed_values)
-                q75, q25 = np.percentile(observed_values, [75, 25])
-                iqr = q75 - q25
-                distr_params[distr_name] = {'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'uniform':
-                dist = stats.uniform
-                loc, scale = dist.fit(observed_values)
-                q75, q25 = np.percentile(observed_values, [75, 25])
-                iqr = q75 - q25
-                distr_params[distr_name] = {'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'triangular':
-                dist = stats.triang
-                c, loc, scale = dist.fit(observed_values)
-                q75, q25 = np.percentile(observed_values, [75, 25])
-                iqr = q75 - q25
-                distr_params[distr_name] = {'c': c, 'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                generated_values[distr_name] = dist.rvs(c=c, loc=loc, scale=scale, size=N)
-            elif distr_name == 'lognormal':
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", RuntimeWarning)
-                    dist = stats.lognorm
-                    s, loc, scale = dist.fit(observed_values)
-                    q75, q25 = np.percentile(observed_values, [75, 25])
-                    iqr = q75 - q25
-                    distr_params[distr_name] = {'s': s, 'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                    generated_values[distr_name] = dist.rvs(s=s, loc=loc, scale=scale, size=N)
-            elif distr_name == 'gamma':
-                dist = stats.gamma
-                a, loc, scale = dist.fit(observed_values)
-                q75, q25 = np.percentile(observed_values, [75, 25])
-                iqr = q75 - q25
-                distr_params[distr_name] = {'a': a, 'loc': loc, 'scale': scale, 'max': q75 + iqr * 1.5, 'mean': np.mean(observed_values)}
-                generated_values[distr_name] = dist.rvs(a=a, loc=loc, scale=scale, size=N)
-        except Exception as e:
-            print(f"An error occurred while fitting distribution {distr_name}: {e}")
-            continue
-
-    wass_distances = {d_name: stats.wasserstein_distance(observed_values, generated_values[d_name]) for d_name in possible_distributions if d_name in generated_values}
-    best_distr = min(wass_distances, key=wass_distances.get)
-
-    return best_distr, distr_params[best_distr], wass_distances
+def find_best_fit_distribution(observed_values, **fit_options):
+    """
+    `best_fit_distribution` with the upper limit and the mean of the sample
+    added to the parameters of every distribution but 'fixed'.
+
+    output: (DISTRNAME, {PARAMS: VALUE}, {DISTRNAME: SCORE}, sampling info or None)
+    """
+    best_distr, params, scores, summary, sampling_info = best_fit_distribution(observed_values, **fit_options)
+    if best_distr != 'fixed':
+        params.update({'max': summary['q75'] + summary['iqr'] * 1.5, 'mean': summary['mean']})
+    return best_distr, params, scores, sampling_info
+
+
+def _execution_times(table):
+    """
+    Pair the events of every case the way a per-trace scan would and return
+    (positions of the measured events, activity codes, resource codes,
+    durations in seconds) in event order:
+
+    - a 'complete' whose previous start/complete of the same activity in the
+      same case is a 'start' yields the time since that start;
+    - any other non-'start' event yields the time since the previous event of
+      its case, attributed to the activity of that previous event.
+    """
+    cases = table[CASE_ID].cat.codes.to_numpy()
+    acts = table[ACTIVITY].cat.codes.to_numpy()
+    resources = table[RESOURCE].cat.codes.to_numpy()
+    timestamps = table[TIMESTAMP].to_numpy()
+    is_start = (table[LIFECYCLE] == 'start').to_numpy()
+    is_complete = (table[LIFECYCLE] == 'complete').to_numpy()
+
+    # Start/complete matching: sort start and complete events by (case, activity, position)
+    # and look at the previous event of the same group
+    paired = np.flatnonzero(is_start | is_complete)
+    paired = paired[np.lexsort((paired, acts[paired], cases[paired]))]
+    prev, cur = paired[:-1], paired[1:]
+    matches = (cases[prev] == cases[cur]) & (acts[prev] == acts[cur]) & is_start[prev] & is_complete[cur]
+    match_start = np.full(len(table), -1)
+    match_start[cur[matches]] = prev[matches]
+    matched = match_start >= 0
+
+    # Everything else that is not a start is measured from the previous event of its case
+    follows = np.zeros(len(table), dtype=bool)
+    follows[1:] = cases[1:] == cases[:-1]
+    unmatched = ~is_start & ~matched & follows
+
+    events = np.flatnonzero(matched | unmatched)
+    start_events = np.where(matched[events], match_start[events], events - 1)
+    activities = np.where(matched[events], acts[events], acts[events - 1])
+    durations = (timestamps[events] - timestamps[start_events]) / 1e9
+
+    return events, activities, resources[events], durations
+
+
+def _group_by_code(codes, durations, labels):
+    if len(codes) == 0:
+        return {}
+    order = np.argsort(codes, kind='stable')
+    codes, durations = codes[order], durations[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    return {labels[code]: group for code, group in zip(codes[np.r_[0, bounds]], np.split(durations, bounds)) if len(group)}
 
 
 def compute_execution_times(log, filter_by_res=None):
-    activities = list(pm4py.get_event_attribute_values(log, 'concept:name').keys())
+    """
+    output: {ACTIVITY_NAME: np.ndarray of execution times in seconds}
+    """
+    table = as_event_table(log)
+    activities = table[ACTIVITY].cat.categories
     print(f"Total activities identified: {len(activities)}")
-    activities_extimes = {a: [] for a in activities}
-    
-    for trace in log:
-        event_dict = {}
-        prev_event = None
-        for event in trace:
-            act = event['concept:name']
-            trans = event['lifecycle:transition']
-            timestamp = event['time:timestamp']
-            res = event.get('org:resource', None)
-
-            if trans == 'start':
-                event_dict[act] = timestamp
-            elif trans == 'complete' and act in event_dict:
-                start_time = event_dict.pop(act)
-                exec_time = (timestamp - start_time).total_seconds()
-                if filter_by_res:
-                    if res in filter_by_res:
-                        activities_extimes[act].append(exec_time)
-                else:
-                    activities_extimes[act].append(exec_time)
-            elif prev_event:
-                exec_time = (timestamp - prev_event['time:timestamp']).total_seconds()
-                if filter_by_res:
-                    if res in filter_by_res:
-                        activities_extimes[prev_event['concept:name']].append(exec_time)
-                else:
-                    activities_extimes[prev_event['concept:name']].append(exec_time)
-            
-            prev_event = event
-    
-    for a in list(activities_extimes.keys()):
-        if not activities_extimes[a]:
-            del activities_extimes[a]
-
-    return activities_extimes
-
-
-def find_execution_distributions(log, mode='activity'):
+
+    _, acts, resources, durations = _execution_times(table)
+    if filter_by_res:
+        keep = np.isin(resources, np.flatnonzero(table[RESOURCE].cat.categories.isin(filter_by_res)))
+        acts, durations = acts[keep], durations[keep]
+
+    extimes = _group_by_code(acts, durations, activities)
+    return {a: extimes[a] for a in activities if a in extimes}
+
+
+def compute_resource_execution_times(log):
+    """
+    Execution times of all resources in a single scan.
+    output: {RESOURCE_NAME: {ACTIVITY_NAME: np.ndarray of execution times in seconds}}
+    """
+    table = as_event_table(log)
+    activities = table[ACTIVITY].cat.categories
+    resources = table[RESOURCE].cat.categories
+
+    _, acts, res, durations = _execution_times(table)
+    keep = res >= 0
+    keys = res[keep].astype(np.int64) * len(activities) + acts[keep]
+    extimes = _group_by_code(keys, durations[keep], range(len(resources) * len(activities)))
+
+    resources_extimes = {r: dict() for r in resources}
+    for key, times in sorted(extimes.items()):
+        resources_extimes[resources[key // len(activities)]][activities[key % len(activities)]] = times
+    return resources_extimes
+
+
+def _merge_execution_times(activities_extimes, batch_extimes):
+    for a, times in batch_extimes.items():
+        activities_extimes.setdefault(a, array('d')).extend(times)
+
+
+def _format_distribution(value):
+    distribution_name, params, _, sampling_info = value
+    formatted = {
+        "distribution_name": distribution_name,
+        "distribution_params": [{"value": v} for v in params.values()]
+    }
+    if sampling_info is not None:
+        formatted["sampling"] = sampling_info
+    return formatted
+
+
+def find_execution_distributions(log, mode='activity', workers=None, **fit_options):
     """
     output: {ACTIVITY_NAME: (DISTRNAME, {PARAMS: VALUE})}
+    or, in mode 'resource': {RESOURCE_NAME: {ACTIVITY_NAME: (DISTRNAME, {PARAMS: VALUE})}}
+
+    `log` may also be a batch iterator from `iter_event_batches`, in which case
+    the log is mined batch by batch without ever being held in memory as a whole.
+    The samples are fitted by `workers` processes (see `miner_common.parallel`),
+    `fit_options` (fit_mode, score, seed, max_samples, sampling) are passed on to
+    `find_best_fit_distribution`.
     """
     if mode == 'activity':
-        activities_extimes = compute_execution_times(log)
+        activities_extimes = dict()
+        for batch in iter_event_tables(log):
+            _merge_execution_times(activities_extimes, compute_execution_times(batch))
         print(f"Activities with computed execution times: {len(activities_extimes)}")
-        activities = list(activities_extimes.keys())
-        exec_distr = {a: find_best_fit_distribution(activities_extimes[a])[:2] for a in activities}
+        exec_distr = fit_samples(find_best_fit_distribution, activities_extimes, workers, **fit_options)
+        return {a: _format_distribution(value) for a, value in exec_distr.items()}
     if mode == 'resource':
-        resources = pm4py.get_event_attribute_values(log, "org:resource")
-        exec_distr = dict()
+        resources_extimes = dict()
+        for batch in iter_event_tables(log):
+            for res, batch_extimes in compute_resource_execution_times(batch).items():
+                _merge_execution_times(resources_extimes.setdefault(res, dict()), batch_extimes)
         print('Finding best fit execution time distribution for each resource...')
-        for res in tqdm(resources):
-            activities_extimes = compute_execution_times(log, filter_by_res=[res])
-            activities = list(activities_extimes.keys())
-            exec_distr[res] = {a: find_best_fit_distribution(activities_extimes[a])[:2] for a in activities}
-    
-    formatted_output = {}
-    for key, value in exec_distr.items():
-        distribution_name, params = value
-        formatted_output[key] = {
-            "distribution_name": distribution_name,
-            "distribution_params": [{"value": v} for v in params.values()]
-        }
-            
-    return formatted_output
+        samples = {(res, a): times for res, activities_extimes in resources_extimes.items() for a, times in activities_extimes.items()}
+        exec_distr = fit_samples(find_best_fit_distribution, samples, workers, **fit_options)
+        formatted_output = {res: dict() for res in resources_extimes}
+        for (res, a), value in exec_distr.items():
+            formatted_output[res][a] = _format_distribution(value)
+        return formatted_output
+
+
+class ExecutionTimesState:
+    """
+    Sufficient statistics of the execution times of a growing log (see
+    `miner_common.sessions`): a SampleStats per activity and, for every case
+    seen within the session horizon, the events that executions in later
+    deltas may be measured from, i.e. its last event and the starts that are
+    not completed yet.
+    """
+
+    def __init__(self):
+        self.stats = dict()
+        self.carry = None
+
+    def update(self, log):
+        """
+        Add the events of `log` (event table or batch iterator), which continue
+        the events added so far.
+        """
+        for batch in iter_event_tables(log):
+            self._update_batch(as_event_table(batch))
+
+    def _update_batch(self, table):
+        carry = self.carry if self.carry is not None else table.iloc[:0]
+        continued = carry[CASE_ID].isin(table[CASE_ID].unique()).to_numpy()
+        carried = int(continued.sum())
+        table = concat_event_tables([carry[continued], table])
+
+        # Events of a case have to be adjacent, with the carried events first
+        order = np.argsort(table[CASE_ID].cat.codes.to_numpy(), kind='stable')
+        table = table.iloc[order].reset_index(drop=True)
+        is_carry = order < carried
+
+        events, acts, _, durations = _execution_times(table)
+        keep = ~is_carry[events]
+        activities = table[ACTIVITY].cat.categories
+        for a, times in _group_by_code(acts[keep], durations[keep], activities).items():
+            self.stats.setdefault(a, SampleStats(seed=DEFAULT_SEED)).update(times)
+
+        self._update_carry(carry[~continued], table)
+
+    def _update_carry(self, carry, table):
+        cases = table[CASE_ID].cat.codes.to_numpy()
+        last_of_case = np.r_[cases[1:] != cases[:-1], True]
+
+        # A later complete is only paired with the last start/complete of its activity if that is a start
+        lifecycles = table[LIFECYCLE]
+        paired = lifecycles.isin(['start', 'complete']).to_numpy()
+        pending = np.zeros(len(table), dtype=bool)
+        pairs = pd.DataFrame({'case': cases, 'activity': table[ACTIVITY].cat.codes.to_numpy()})[paired]
+        pending[pairs.drop_duplicates(keep='last').index] = True
+        pending &= (lifecycles == 'start').to_numpy()
+
+        carry = concat_event_tables([carry, table[last_of_case | pending]]).reset_index(drop=True)
+        horizon = session_horizon()
+        if horizon is not None and len(carry):
+            timestamps = carry[TIMESTAMP]
+            last_seen = timestamps.groupby(carry[CASE_ID], observed=True).transform('max')
+            carry = carry[(last_seen >= timestamps.max() - horizon).to_numpy()].reset_index(drop=True)
+        for column in [CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE]:
+            carry[column] = carry[column].cat.remove_unused_categories()
+        self.carry = carry
+
+
+def find_session_distributions(state, **fit_options):
+    """
+    Activity distributions from an ExecutionTimesState, fitted on the sample
+    of every activity with the exact moments and extremes of all its times,
+    and scored against its sketch.
+    output: same as `find_execution_distributions` in mode 'activity'
+    """
+    return {
+        a: _format_distribution(find_best_fit_distribution(stats.sample, sketch=stats.sketch, summary=stats.summary(), **fit_options))
+        for a, stats in state.stats.items()
+    }
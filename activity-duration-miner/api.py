@@ -1,15 +1,40 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pm4py
-import os
-import tempfile
-from activities_duration import find_execution_distributions
-from pm4py.objects.log.importer.xes import importer as xes_importer
+from activities_duration import find_execution_distributions, find_session_distributions, ExecutionTimesState
+from miner_common.fitting import fit_options_from_args
+from miner_common.jobs import Task, job_blueprint
+from miner_common.log_cache import log_cache
+from miner_common.parallel import workers_from_args
+from miner_common.sessions import SessionMiner, session_blueprint
 import json
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
+def validate_args(args):
+    fit_options_from_args(args)
+    workers_from_args(args)
+
+def mine_activity_durations(stream, args):
+    # Stream the uploaded (optionally gzip compressed) XES in batches of whole traces
+    log = log_cache.iter_event_batches(stream)
+    acd = find_execution_distributions(log, workers=workers_from_args(args), **fit_options_from_args(args))
+    return json.dumps(acd)
+
+app.register_blueprint(job_blueprint({
+    'activity_duration': Task(mine_activity_durations, validate_args),
+}))
+
+def update_execution_times(state, stream, args):
+    state.update(log_cache.iter_event_batches(stream))
+
+def session_activity_durations(state, args):
+    return json.dumps(find_session_distributions(state, **fit_options_from_args(args)))
+
+app.register_blueprint(session_blueprint({
+    'activity_duration': SessionMiner(ExecutionTimesState, update_execution_times, session_activity_durations, fit_options_from_args),
+}))
+
 @app.route('/activity_duration', methods=['POST'])
 def upload_xes():
     if 'file' not in request.files:
@@ -17,28 +42,24 @@ def upload_xes():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    if file and file.filename.endswith('.xes'):
-        # Create a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xes')
-        file.save(temp_file.name)
-        temp_file.close()
-
-        try:
-            # Read the XES file using pm4py
-            log = xes_importer.apply(temp_file.name)
-        finally:
-            # Ensure the temporary file is removed
-            os.remove(temp_file.name)
-
+    try:
+        validate_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if file and file.filename.endswith(('.xes', '.xes.gz')):
         # Process the log
-        acd = find_execution_distributions(log)
+        acd = mine_activity_durations(file.stream, request.args)
         
         return app.response_class(
-            response=json.dumps(acd),
+            response=acd,
             mimetype='application/json'
         )
     else:
-        return jsonify({'error': 'Invalid file format. Please upload a .xes file'}), 400
+        return jsonify({'error': 'Invalid file format. Please upload a .xes or .xes.gz file'}), 400
+
+@app.route('/log-cache', methods=['GET'])
+def log_cache_stats():
+    return jsonify(log_cache.stats())
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8002)
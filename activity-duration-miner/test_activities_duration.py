@@ -0,0 +1,66 @@
+"""
+Regression tests for logs without any measurable execution time and for the
+state of the session endpoints.
+
+Run from the activity-duration-miner directory (with the repository root on the path):
+    PYTHONPATH=.. python -m pytest -q test_activities_duration.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from miner_common.event_log import CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE, TIMESTAMP
+from activities_duration import (compute_execution_times, compute_resource_execution_times, find_execution_distributions,
+                                 ExecutionTimesState, find_session_distributions)
+
+
+def event_table(cases, activities, lifecycles):
+    return pd.DataFrame({
+        CASE_ID: pd.Categorical(cases),
+        ACTIVITY: pd.Categorical(activities),
+        RESOURCE: pd.Categorical(['R1'] * len(cases)),
+        LIFECYCLE: pd.Categorical(lifecycles),
+        TIMESTAMP: pd.Timestamp('2024-01-01').value + np.arange(len(cases), dtype=np.int64) * 60 * 10**9,
+    })
+
+
+def test_single_event_traces():
+    table = event_table(['1', '2', '3'], ['A', 'B', 'A'], ['complete'] * 3)
+    assert compute_execution_times(table) == {}
+    assert compute_resource_execution_times(table) == {'R1': {}}
+    assert find_execution_distributions(table) == {}
+
+
+def test_batches_without_pairs():
+    batches = iter([
+        event_table(['1', '2'], ['A', 'B'], ['complete', 'complete']),
+        event_table(['3', '3'], ['A', 'B'], ['start', 'start']),
+    ])
+    assert find_execution_distributions(batches, mode='resource') == {'R1': {}}
+
+
+def test_session_delta_of_start_events():
+    state = ExecutionTimesState()
+    state.update(event_table(['1', '2'], ['A', 'A'], ['start', 'start']))
+    assert find_session_distributions(state) == {}
+
+    state.update(event_table(['1', '2'], ['A', 'A'], ['complete', 'complete']))
+    assert list(find_session_distributions(state)) == ['A']
+
+
+def test_session_carry_keeps_pending_starts_only():
+    state = ExecutionTimesState()
+    state.update(event_table(['1', '1', '1', '2', '2'], ['A', 'A', 'B', 'A', 'B'],
+                             ['start', 'complete', 'start', 'start', 'complete']))
+    # Case 1: its last event, the pending start of B; case 2: its last event and the pending start of A
+    assert sorted(zip(state.carry[CASE_ID], state.carry[ACTIVITY])) == [('1', 'B'), ('2', 'A'), ('2', 'B')]
+
+    state.update(event_table(['1', '2'], ['B', 'A'], ['complete', 'complete']))
+    assert sorted(zip(state.carry[CASE_ID], state.carry[ACTIVITY])) == [('1', 'B'), ('2', 'A')]
+
+
+def test_session_carry_forgets_idle_cases(monkeypatch):
+    monkeypatch.setenv('MINER_SESSION_HORIZON', '600')
+    state = ExecutionTimesState()
+    state.update(event_table(['1'] + ['2'] * 20, ['A'] * 21, ['start'] + ['complete'] * 20))
+    assert list(state.carry[CASE_ID].unique()) == ['2']
@@ -0,0 +1,54 @@
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from discovery import discover, miners_from_args
+from miner_common.fitting import fit_options_from_args
+from miner_common.jobs import Task, job_blueprint
+from miner_common.log_cache import log_cache
+import json
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+
+def validate_args(args):
+    fit_options_from_args(args)
+    miners_from_args(args)
+
+def mine_all(stream, args):
+    log = log_cache.read_event_table(stream)
+    results, errors = discover(log, miners=miners_from_args(args), **fit_options_from_args(args))
+    return json.dumps({**results, 'errors': errors})
+
+app.register_blueprint(job_blueprint({
+    'discovery': Task(mine_all, validate_args),
+}))
+
+@app.route('/discovery', methods=['POST'])
+def discovery():
+    """
+    Mine BPMN model, role resources, resource calendars, activity durations and
+    the inter-arrival distribution of one uploaded log.
+
+    output: {"bpmn": XML, "role_resources": [...], "resource_calendars": [...],
+             "activity_durations": {...}, "inter_arrival": {...}, "errors": {MINER: MESSAGE}}
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    try:
+        validate_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return app.response_class(
+        response=mine_all(file.stream, request.args),
+        mimetype='application/json'
+    )
+
+@app.route('/log-cache', methods=['GET'])
+def log_cache_stats():
+    return jsonify(log_cache.stats())
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=8004)
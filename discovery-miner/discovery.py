@@ -0,0 +1,108 @@
+"""
+All miners on one parsed log.
+
+The log is parsed once into an event table; the miners then run side by
+side in a process pool forked from the process holding the table, so the
+table is shared copy-on-write instead of being sent to every worker.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from activities_duration import find_execution_distributions
+from inductive import discover_bpmn
+from interarrival import find_inter_arrival_distribution
+from resource_calendars import structured_resource_calendar
+from role_resource import get_activity_resources
+from resource_index import resource_index
+from miner_common.event_log import as_event_table
+
+MINERS = ['bpmn', 'role_resources', 'resource_calendars', 'activity_durations', 'inter_arrival']
+
+# Event table of the discovery a pool worker belongs to, set by `_init_worker` in the worker only
+_worker_table = None
+
+
+def default_workers():
+    return int(os.environ.get('MINER_DISCOVERY_WORKERS', os.cpu_count() or 1))
+
+
+def miners_from_args(args):
+    """
+    Miners from the comma separated `miners` query argument of a request.
+    Raises ValueError for invalid values.
+    """
+    if 'miners' not in args:
+        return None
+    miners = [miner.strip() for miner in args['miners'].split(',') if miner.strip()]
+    unknown = [miner for miner in miners if miner not in MINERS]
+    if unknown or not miners:
+        raise ValueError(f'Invalid miners. Expected a comma separated list of {MINERS}')
+    return miners
+
+
+def mine(miner, table, fit_workers=None, **fit_options):
+    if miner == 'bpmn':
+        return discover_bpmn(table).decode()
+    if miner == 'role_resources':
+        return get_activity_resources(table)
+    if miner == 'resource_calendars':
+        return structured_resource_calendar(table)
+    if miner == 'activity_durations':
+        return find_execution_distributions(table, workers=fit_workers, **fit_options)
+    if miner == 'inter_arrival':
+        return find_inter_arrival_distribution(table, **fit_options)
+    raise ValueError(f'Unknown miner: {miner}')
+
+
+def _init_worker(table):
+    # The pool forks its workers, so `table` is inherited rather than pickled
+    global _worker_table
+    _worker_table = table
+
+
+def _mine_shared(miner, fit_options):
+    try:
+        # Nested fitting pools would only compete with the other miners for the CPUs
+        return mine(miner, _worker_table, fit_workers=1, **fit_options), None
+    except Exception as e:
+        return None, str(e)
+
+
+def discover(log, miners=None, workers=None, **fit_options):
+    """
+    Run `miners` (default: all of MINERS) on `log`, using `workers` processes.
+    `fit_options` are passed on to the activity-duration and inter-arrival miners.
+
+    output: ({MINER: RESULT}, {MINER: ERROR MESSAGE})
+    """
+    table = as_event_table(log)
+    miners = MINERS if miners is None else miners
+    workers = min(default_workers() if workers is None else workers, len(miners))
+
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        outcomes = []
+        for miner in miners:
+            try:
+                outcomes.append((mine(miner, table, **fit_options), None))
+            except Exception as e:
+                outcomes.append((None, str(e)))
+    else:
+        if 'role_resources' in miners and 'resource_calendars' in miners:
+            # Built once before the fork, both workers find it in the index memo of the table
+            resource_index(table)
+        # Each call has a pool of its own, concurrent discoveries never see each other's table
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_worker, initargs=(table,)) as executor:
+            outcomes = list(executor.map(_mine_shared, miners, [fit_options] * len(miners)))
+
+    results = dict()
+    errors = dict()
+    for miner, (result, error) in zip(miners, outcomes):
+        if error is None:
+            results[miner] = result
+        else:
+            print(f"An error occurred while mining {miner}: {error}")
+            errors[miner] = error
+    return results, errors
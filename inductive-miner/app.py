@@ -1,9 +1,11 @@
-from flask import Flask, request, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pm4py
-from pm4py.objects.bpmn.exporter import exporter as bpmn_exporter
-import os
+from inductive import discover_bpmn, discovery_options_from_args
+from miner_common.jobs import Task, job_blueprint
+from miner_common.log_cache import log_cache
+import gzip
 import logging
+import time
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS
@@ -11,11 +13,50 @@ CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Smaller models are sent uncompressed, gzip would not pay off
+GZIP_MIN_SIZE = 16 * 1024
+
+def mine_bpmn(stream, args=None, timings=None):
+    timings = dict() if timings is None else timings
+    start = time.perf_counter()
+    log = log_cache.read_event_table(stream)
+    timings['parse'] = time.perf_counter() - start
+    return discover_bpmn(log, timings=timings, **discovery_options_from_args(args or {}))
+
+def server_timing(timings):
+    """
+    Server-Timing header value of the stage durations recorded by `mine_bpmn`.
+    """
+    stats = timings['variant_stats']
+    metrics = []
+    for stage in ['parse', 'variants', 'discover', 'layout', 'export', 'compress']:
+        if stage not in timings:
+            continue
+        metric = f'{stage};dur={timings[stage] * 1000:.1f}'
+        if stage == 'variants':
+            metric += f';desc="{stats["kept_variants"]} of {stats["variants"]} variants, {stats["kept_cases"]} of {stats["cases"]} cases"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+def bpmn_response(bpmn, timings):
+    """
+    Download response of the model, gzip encoded if the client accepts it.
+    """
+    headers = {'Content-Disposition': 'attachment; filename=output.bpmn', 'Vary': 'Accept-Encoding'}
+    if len(bpmn) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        start = time.perf_counter()
+        bpmn = gzip.compress(bpmn, compresslevel=6)
+        timings['compress'] = time.perf_counter() - start
+        headers['Content-Encoding'] = 'gzip'
+    headers['Server-Timing'] = server_timing(timings)
+    return Response(bpmn, mimetype='application/octet-stream', headers=headers)
+
+app.register_blueprint(job_blueprint({
+    'process_log': Task(mine_bpmn, discovery_options_from_args, mimetype='application/octet-stream', filename='output.bpmn'),
+}))
+
 @app.route('/process_log', methods=['POST'])
 def process_log():
-    log_path = None
-    output_path = None
-    
     try:
         if 'file' not in request.files:
             return "No file part in the request", 400
@@ -24,28 +65,22 @@ def process_log():
         if file.filename == '':
             return "No selected file", 400
 
+        try:
+            discovery_options_from_args(request.args)
+        except ValueError as e:
+            return str(e), 400
+
         if file:
-            log_path = os.path.join("/tmp", file.filename)
-            file.save(log_path)
-            
-            log = pm4py.read_xes(log_path)
-            bpmn_graph = pm4py.discover_bpmn_inductive(log)
-            
-            # Apply layout to avoid overlapping elements
-            pm4py.objects.bpmn.layout.variants.graphviz.apply(bpmn_graph)
-            
-            output_path = os.path.join("/tmp", "output.bpmn")
-            bpmn_exporter.apply(bpmn_graph, output_path)
-            
-            return send_file(output_path, as_attachment=True)
+            timings = dict()
+            bpmn = mine_bpmn(file.stream, request.args, timings)
+            return bpmn_response(bpmn, timings)
     except Exception as e:
         logging.error(f"Error processing file: {e}")
         return f"An error occurred: {str(e)}", 500
-    finally:
-        if log_path and os.path.exists(log_path):
-            os.remove(log_path)
-        if output_path and os.path.exists(output_path):
-            os.remove(output_path)
+
+@app.route('/log-cache', methods=['GET'])
+def log_cache_stats():
+    return jsonify(log_cache.stats())
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=8000)
@@ -0,0 +1,56 @@
+"""
+Benchmark of the layered layout against pm4py's graphviz layout, on the
+models discovered from the example logs and on random models of growing size.
+
+Run from the inductive-miner directory (with the repository root on the path):
+    PYTHONPATH=.. python benchmark_layout.py
+"""
+
+import time
+from pathlib import Path
+
+import pm4py
+from pm4py.algo.simulation.tree_generator import algorithm as tree_generator
+
+import layout
+from inductive import variant_counts, IMDataStructureUVCL, IMUVCL
+
+EVENT_LOGS = Path(__file__).resolve().parent.parent / 'example_data' / 'event_logs'
+
+
+def example_models():
+    for path in sorted(EVENT_LOGS.glob('*.xes')):
+        variants = variant_counts(pm4py.read_xes(str(path)))
+        process_tree = IMUVCL(dict()).apply(IMDataStructureUVCL(variants), dict())
+        yield path.name, process_tree
+
+
+def random_models():
+    for activities in [50, 200, 500]:
+        process_tree = tree_generator.apply(parameters={'min': activities, 'mode': activities, 'max': activities})
+        yield f'random ({activities} activities)', process_tree
+
+
+def timed(function, process_tree):
+    # Both layouts change the graph in place, every run gets a model of its own
+    bpmn_graph = pm4py.convert_to_bpmn(process_tree)
+    start = time.perf_counter()
+    function(bpmn_graph)
+    return time.perf_counter() - start
+
+
+def graphviz_time(process_tree):
+    try:
+        return f'{timed(pm4py.objects.bpmn.layout.variants.graphviz.apply, process_tree):14.3f}'
+    except Exception as e:
+        print(f'graphviz layout failed: {e}')
+        return f"{'-':>14}"
+
+
+if __name__ == '__main__':
+    rows = [(name, process_tree) for models in [example_models(), random_models()] for name, process_tree in models]
+    print(f"{'model':>30} {'nodes':>6} {'flows':>6} {'layered (s)':>12} {'graphviz (s)':>14}")
+    for name, process_tree in rows:
+        bpmn_graph = pm4py.convert_to_bpmn(process_tree)
+        layered = timed(layout.apply, process_tree)
+        print(f'{name:>30} {len(bpmn_graph.get_nodes()):>6} {len(bpmn_graph.get_flows()):>6} {layered:12.3f} {graphviz_time(process_tree)}')
@@ -0,0 +1,132 @@
+"""
+Inductive mining of a BPMN model.
+
+The log is first compressed into its variants, i.e. the distinct activity
+sequences with the number of cases following each of them, so that the
+miner works on unique traces only and its run time depends on the number of
+variants rather than on the number of cases. Rare variants can be dropped
+beforehand (`top_k`, `coverage`) and the infrequent variant of the miner can
+be used to filter noise (`noise_threshold`).
+
+The model is laid out by the built-in layered layout (`layout.py`) unless
+`layout` asks for pm4py's graphviz layout or for no layout at all, in which
+case the BPMN is exported without diagram interchange (DI) shapes and edges.
+"""
+
+import time
+from collections import Counter
+import numpy as np
+import pm4py
+from pm4py.algo.discovery.inductive.dtypes.im_ds import IMDataStructureUVCL
+from pm4py.algo.discovery.inductive.variants.im import IMUVCL
+from pm4py.algo.discovery.inductive.variants.imf import IMFUVCL
+from pm4py.objects.bpmn.exporter.variants import etree as bpmn_xml
+from pm4py.objects.process_tree.utils.generic import fold, tree_sort
+from miner_common.event_log import as_event_table, CASE_ID, ACTIVITY, TIMESTAMP
+import layout as layered_layout
+
+LAYOUTS = ['layered', 'graphviz', 'none']
+
+def variant_counts(log):
+    """
+    output: Counter {(ACTIVITY, ...): NUMBER OF CASES}, with the events of a
+    case ordered by timestamp as pm4py does
+    """
+    table = as_event_table(log)
+    cases = table[CASE_ID].cat.codes.to_numpy()
+    order = np.lexsort((table[TIMESTAMP].to_numpy(), cases))
+    acts = table[ACTIVITY].cat.codes.to_numpy().astype(np.int32)[order]
+    bounds = np.flatnonzero(np.diff(cases[order])) + 1
+
+    counts = Counter(trace.tobytes() for trace in np.split(acts, bounds) if len(trace))
+    activities = table[ACTIVITY].cat.categories
+    return Counter({
+        tuple(activities[np.frombuffer(trace, dtype=np.int32)]): count
+        for trace, count in counts.items()
+    })
+
+def filter_variants(variants, top_k=None, coverage=None):
+    """
+    Keep the `top_k` most frequent variants and of those the most frequent
+    ones that together cover at least the `coverage` share of the cases.
+
+    output: (filtered Counter, {variants, cases, kept_variants, kept_cases})
+    """
+    ranked = variants.most_common(top_k)
+    total = sum(variants.values())
+    if coverage is not None:
+        covered = np.cumsum([count for _, count in ranked])
+        ranked = ranked[:int(np.searchsorted(covered, coverage * total)) + 1]
+
+    kept = Counter(dict(ranked))
+    return kept, {
+        'variants': len(variants),
+        'cases': total,
+        'kept_variants': len(kept),
+        'kept_cases': sum(kept.values()),
+    }
+
+def discover_bpmn(log, noise_threshold=0.0, top_k=None, coverage=None, layout='layered', timings=None):
+    """
+    Discover a BPMN model of `log` (event table, pm4py EventLog or DataFrame)
+    with the inductive miner and lay it out with `layout` (one of LAYOUTS). When a dict is passed as `timings`, the duration
+    of every stage in seconds and the variant statistics are recorded in it.
+
+    output: BPMN 2.0 XML (bytes)
+    """
+    timings = dict() if timings is None else timings
+
+    start = time.perf_counter()
+    variants, timings['variant_stats'] = filter_variants(variant_counts(log), top_k, coverage)
+    timings['variants'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parameters = {'noise_threshold': noise_threshold, 'multiprocessing': False, 'disable_fallthroughs': False}
+    miner = IMFUVCL(parameters) if noise_threshold > 0 else IMUVCL(parameters)
+    process_tree = fold(miner.apply(IMDataStructureUVCL(variants), parameters))
+    tree_sort(process_tree)
+    bpmn_graph = pm4py.convert_to_bpmn(process_tree)
+    timings['discover'] = time.perf_counter() - start
+
+    # Apply layout to avoid overlapping elements
+    start = time.perf_counter()
+    if layout == 'layered':
+        layered_layout.apply(bpmn_graph)
+    elif layout == 'graphviz':
+        pm4py.objects.bpmn.layout.variants.graphviz.apply(bpmn_graph)
+    timings['layout'] = time.perf_counter() - start
+
+    # Serialised in memory, no file is shared between concurrent requests
+    start = time.perf_counter()
+    bpmn = bpmn_xml.get_xml_string(bpmn_graph, parameters={bpmn_xml.Parameters.ENABLE_BPMN_PLANE_EXPORTING: layout != 'none'})
+    timings['export'] = time.perf_counter() - start
+    return bpmn
+
+def discovery_options_from_args(args):
+    """
+    Discovery options (`noise_threshold`, `top_k`, `coverage`, `layout`) from the query
+    arguments of a request. Raises ValueError for invalid values.
+    """
+    options = dict()
+    try:
+        if 'noise_threshold' in args:
+            options['noise_threshold'] = float(args['noise_threshold'])
+        if 'top_k' in args:
+            options['top_k'] = int(args['top_k'])
+        if 'coverage' in args:
+            options['coverage'] = float(args['coverage'])
+    except ValueError:
+        raise ValueError('Invalid discovery options. Expected a number for noise_threshold, top_k and coverage')
+
+    if not 0 <= options.get('noise_threshold', 0) <= 1:
+        raise ValueError('Invalid noise_threshold. Expected a number between 0 and 1')
+    if options.get('top_k', 1) < 1:
+        raise ValueError('Invalid top_k. Expected a positive integer')
+    if not 0 < options.get('coverage', 1) <= 1:
+        raise ValueError('Invalid coverage. Expected a number in (0, 1]')
+
+    if 'layout' in args:
+        if args['layout'] not in LAYOUTS:
+            raise ValueError(f'Invalid layout. Expected one of {LAYOUTS}')
+        options['layout'] = args['layout']
+    return options
@@ -0,0 +1,242 @@
+"""
+Layered (Sugiyama style) layout of BPMN graphs from left to right, a pure
+Python alternative to pm4py's graphviz layout that needs no graphviz binary
+and no subprocess per request:
+
+1. cycles are broken by reversing the back edges of a depth first search,
+2. every node is put into the layer of its longest path from a source,
+3. edges spanning several layers are split by dummy nodes,
+4. crossings are reduced by barycenter sweeps down and up the layers,
+5. every node is placed next to the barycenter of its predecessors,
+6. flows are routed orthogonally through their dummy nodes.
+
+Each sweep and step is linear in the nodes and edges, apart from sorting the
+nodes of a layer by their barycenters.
+"""
+
+from collections import defaultdict, deque
+
+from pm4py.objects.bpmn.obj import BPMN
+from pm4py.objects.bpmn.util.sorting import get_sorted_nodes_edges
+
+TASK_HEIGHT = 60
+EVENT_SIZE = 30
+GATEWAY_SIZE = 60
+LAYER_GAP = 50
+NODE_GAP = 30
+SWEEPS = 4
+
+
+def node_size(node):
+    """
+    output: (width, height) of `node`, the sizes of pm4py's graphviz layout
+    """
+    if isinstance(node, BPMN.Task):
+        return min(2 * TASK_HEIGHT, round(2 * (len(node.get_name()) + 7) * TASK_HEIGHT / 22.0)), TASK_HEIGHT
+    if isinstance(node, (BPMN.StartEvent, BPMN.EndEvent)):
+        return EVENT_SIZE, EVENT_SIZE
+    return GATEWAY_SIZE, GATEWAY_SIZE
+
+
+def _acyclic_edges(n_nodes, edges):
+    """
+    output: [(SOURCE, TARGET, REVERSED)], the back edges of a depth first
+    search from the sources reversed and self loops dropped
+    """
+    successors = defaultdict(list)
+    has_predecessor = [False] * n_nodes
+    for index, (source, target) in enumerate(edges):
+        successors[source].append((target, index))
+        has_predecessor[target] = True
+
+    reversed_edges = set()
+    state = [0] * n_nodes  # 0 unvisited, 1 on the stack, 2 done
+    roots = [v for v in range(n_nodes) if not has_predecessor[v]] + list(range(n_nodes))
+    for root in roots:
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child, index in children:
+                if state[child] == 1:
+                    reversed_edges.add(index)
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+
+    return [
+        (target, source, True) if index in reversed_edges else (source, target, False)
+        for index, (source, target) in enumerate(edges)
+        if source != target
+    ]
+
+
+def _longest_path_layers(n_nodes, edges):
+    successors = defaultdict(list)
+    in_degree = [0] * n_nodes
+    for source, target, _ in edges:
+        successors[source].append(target)
+        in_degree[target] += 1
+
+    layers = [0] * n_nodes
+    queue = deque(v for v in range(n_nodes) if in_degree[v] == 0)
+    while queue:
+        node = queue.popleft()
+        for child in successors[node]:
+            layers[child] = max(layers[child], layers[node] + 1)
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append(child)
+    return layers
+
+
+def _reduce_crossings(layers, predecessors, successors):
+    position = dict()
+    for layer in layers:
+        for index, node in enumerate(layer):
+            position[node] = index
+
+    def sweep(order, neighbours):
+        for layer in order:
+            barycenters = dict()
+            for node in layer:
+                adjacent = neighbours[node]
+                barycenters[node] = sum(position[v] for v in adjacent) / len(adjacent) if adjacent else position[node]
+            layer.sort(key=barycenters.__getitem__)
+            for index, node in enumerate(layer):
+                position[node] = index
+
+    for _ in range(SWEEPS):
+        sweep(layers[1:], predecessors)
+        sweep(layers[-2::-1], successors)
+
+
+def _place_layer(layer, sizes, desired):
+    """
+    Centers y of the nodes of `layer` as close to `desired` as the order of
+    the layer and the gaps between its nodes allow.
+    """
+    y = []
+    for index, node in enumerate(layer):
+        if index == 0:
+            y.append(desired[index])
+            continue
+        gap = (sizes[layer[index - 1]][1] + sizes[node][1]) / 2 + NODE_GAP
+        y.append(max(desired[index], y[-1] + gap))
+    # The forward pass only pushes nodes down, center the layer on the desired positions again
+    shift = sum(placed - wanted for placed, wanted in zip(y, desired)) / len(y)
+    return [placed - shift for placed in y]
+
+
+def apply(bpmn_graph, parameters=None):
+    """
+    Lay out `bpmn_graph` in place: sets the bounds of every node and the
+    waypoints of every flow.
+
+    output: `bpmn_graph`
+    """
+    nodes, edges = get_sorted_nodes_edges(bpmn_graph)
+    if not nodes:
+        return bpmn_graph
+    index = {node: i for i, node in enumerate(nodes)}
+    sizes = [node_size(node) for node in nodes]
+    dag_edges = _acyclic_edges(len(nodes), [(index[source], index[target]) for source, target in edges])
+    node_layers = _longest_path_layers(len(nodes), dag_edges)
+
+    # Dummy nodes (zero sized) on every layer an edge passes
+    predecessors = defaultdict(list)
+    successors = defaultdict(list)
+    chains = dict()
+    for source, target, is_reversed in dag_edges:
+        chain = [source]
+        for layer in range(node_layers[source] + 1, node_layers[target]):
+            chain.append(len(sizes))
+            sizes.append((0, 0))
+            node_layers.append(layer)
+        chain.append(target)
+        for u, v in zip(chain, chain[1:]):
+            successors[u].append(v)
+            predecessors[v].append(u)
+        chains[(source, target) if not is_reversed else (target, source)] = (chain, is_reversed)
+
+    layers = [[] for _ in range(max(node_layers) + 1)]
+    for node, layer in enumerate(node_layers):
+        layers[layer].append(node)
+    _reduce_crossings(layers, predecessors, successors)
+
+    # x by layer, the nodes of a layer centered in its column
+    center_x = [0.0] * len(sizes)
+    column = 0.0
+    for layer in layers:
+        width = max(sizes[node][0] for node in layer)
+        for node in layer:
+            center_x[node] = column + width / 2
+        column += width + LAYER_GAP
+
+    # y next to the barycenter of the predecessors, layer by layer
+    center_y = [0.0] * len(sizes)
+    for layer in layers:
+        desired = []
+        for node in layer:
+            if predecessors[node]:
+                desired.append(sum(center_y[v] for v in predecessors[node]) / len(predecessors[node]))
+            else:
+                desired.append(desired[-1] if desired else 0.0)
+        for node, y in zip(layer, _place_layer(layer, sizes, desired)):
+            center_y[node] = y
+
+    top = min(center_y[v] - sizes[v][1] / 2 for v in range(len(sizes)))
+    center_y = [y - top + NODE_GAP for y in center_y]
+    center_x = [x + NODE_GAP for x in center_x]
+
+    layout = bpmn_graph.get_layout()
+    for node, i in index.items():
+        width, height = sizes[i]
+        layout.get(node).set_x(center_x[i] - width / 2)
+        layout.get(node).set_y(center_y[i] - height / 2)
+        layout.get(node).set_width(width)
+        layout.get(node).set_height(height)
+
+    for flow in bpmn_graph.get_flows():
+        source, target = index[flow.get_source()], index[flow.get_target()]
+        flow.del_waypoints()
+        if source == target:
+            _route_self_loop(flow, center_x[source], center_y[source], sizes[source])
+            continue
+        chain, is_reversed = chains[(source, target)]
+        waypoints = _route(chain, center_x, center_y, sizes)
+        for waypoint in reversed(waypoints) if is_reversed else waypoints:
+            flow.add_waypoint(waypoint)
+    return bpmn_graph
+
+
+def _route(chain, center_x, center_y, sizes):
+    """
+    output: orthogonal waypoints from the right side of the first node of
+    `chain` over its dummy nodes to the left side of its last node
+    """
+    first, last = chain[0], chain[-1]
+    x, y = center_x[first] + sizes[first][0] / 2, center_y[first]
+    waypoints = [(x, y)]
+    for node in chain[1:]:
+        next_x, next_y = center_x[node] - sizes[node][0] / 2, center_y[node]
+        if next_y != y:
+            middle = (x + next_x) / 2
+            waypoints += [(middle, y), (middle, next_y)]
+        x, y = center_x[node] + sizes[node][0] / 2, next_y
+    waypoints.append((center_x[last] - sizes[last][0] / 2, center_y[last]))
+    return waypoints
+
+
+def _route_self_loop(flow, x, y, size):
+    width, height = size
+    top = y - height / 2 - NODE_GAP / 2
+    for waypoint in [(x + width / 2, y), (x + width / 2 + NODE_GAP / 2, y), (x + width / 2 + NODE_GAP / 2, top),
+                     (x - width / 2 - NODE_GAP / 2, top), (x - width / 2 - NODE_GAP / 2, y), (x - width / 2, y)]:
+        flow.add_waypoint(waypoint)
@@ -1,13 +1,40 @@
 # api_flask.py
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from interarrival import find_inter_arrival_distribution
+from interarrival import find_inter_arrival_distribution, inter_arrival_options_from_args, InterArrivalState
+from miner_common.fitting import fit_options_from_args
+from miner_common.jobs import Task, job_blueprint
+from miner_common.log_cache import log_cache
+from miner_common.sessions import SessionMiner, session_blueprint
 import json
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
+def mine_inter_arrival(stream, args):
+    log = log_cache.iter_event_batches(stream)
+    return json.dumps(find_inter_arrival_distribution(log, **inter_arrival_options_from_args(args)))
+
+app.register_blueprint(job_blueprint({
+    'inter-arrival': Task(mine_inter_arrival, inter_arrival_options_from_args),
+}))
+
+def update_inter_arrival(state, stream, args):
+    state.update(log_cache.iter_event_batches(stream), inter_arrival_options_from_args(args).get('case_start', 'start'))
+
+def session_options_from_args(args):
+    options = inter_arrival_options_from_args(args)
+    if options.get('arrival_model', 'stationary') != 'stationary':
+        raise ValueError('Sessions only support arrival_model=stationary')
+    return options
+
+def session_inter_arrival(state, args):
+    return json.dumps(state.result(**fit_options_from_args(args)))
+
+app.register_blueprint(session_blueprint({
+    'inter-arrival': SessionMiner(InterArrivalState, update_inter_arrival, session_inter_arrival, session_options_from_args),
+}))
+
 @app.route('/inter-arrival', methods=['POST'])
 def upload_log():
     if 'file' not in request.files:
@@ -18,17 +45,22 @@ def upload_log():
     if file.filename == '':
         return "No selected file", 400
 
-    if file:
-        filepath = "inter-arrival.xes"
-        file.save(filepath)
+    try:
+        inter_arrival_options_from_args(request.args)
+    except ValueError as e:
+        return str(e), 400
 
-        log = xes_importer.apply(filepath)
-        arrival_distribution = find_inter_arrival_distribution(log)
+    if file:
+        arrival_distribution = mine_inter_arrival(file.stream, request.args)
         
         return app.response_class(
-            response=json.dumps(arrival_distribution),
+            response=arrival_distribution,
             mimetype='application/json'
         )
 
+@app.route('/log-cache', methods=['GET'])
+def log_cache_stats():
+    return jsonify(log_cache.stats())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8003)
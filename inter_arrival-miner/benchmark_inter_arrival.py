@@ -0,0 +1,39 @@
+"""
+Times `compute_inter_arrival_times` on synthetic logs (see
+`miner_common.benchmark`) and checks it against the per-trace scan for the
+first 'start' event that it replaced; the scan is skipped above 100k cases.
+
+    cd inter_arrival-miner && PYTHONPATH=.. python benchmark_inter_arrival.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from miner_common.benchmark import synthetic_table, timed
+from miner_common.event_log import CASE_ID, LIFECYCLE, TIMESTAMP
+from interarrival import compute_inter_arrival_times
+
+
+def per_trace_inter_arrival_times(table):
+    start_times = []
+    for _, trace in table.groupby(CASE_ID, sort=False, observed=True):
+        for lifecycle, timestamp in zip(trace[LIFECYCLE], trace[TIMESTAMP]):
+            if lifecycle == 'start':
+                start_times.append(pd.Timestamp(timestamp, tz='UTC').to_pydatetime())
+                break
+    start_times.sort()
+    return [(b - a).total_seconds() for a, b in zip(start_times, start_times[1:])]
+
+
+if __name__ == '__main__':
+    print(f"{'cases':>10} {'events':>10} {'vectorized (s)':>15} {'per trace (s)':>14}")
+    for n_cases in [10_000, 100_000, 1_000_000]:
+        table = synthetic_table(n_cases)
+        result, vectorized_time = timed(compute_inter_arrival_times, table)
+        if n_cases <= 100_000:
+            expected, reference_time = timed(per_trace_inter_arrival_times, table)
+            assert np.allclose(result, expected), 'inter-arrival times differ'
+            reference = f'{reference_time:14.3f}'
+        else:
+            reference = f"{'-':>14}"
+        print(f'{n_cases:>10} {len(table):>10} {vectorized_time:15.3f} {reference}')
@@ -1,116 +1,222 @@
 # computation.py
 
+import zoneinfo
 import numpy as np
-import scipy.stats as stats
-import warnings
-from pm4py.objects.log.importer.xes import importer as xes_importer
+import pandas as pd
+from miner_common.event_log import iter_event_tables, CASE_ID, LIFECYCLE, TIMESTAMP
+from miner_common.fitting import best_fit_distribution, fit_options_from_args, DEFAULT_SEED
+from miner_common.parallel import fit_samples, workers_from_args
+from miner_common.sessions import session_horizon
+from miner_common.sketch import SampleStats
 from typing import Dict, Any, List
 
-possible_distributions = [
-    'fixed',
-    'normal',
-    'exponential',
-    'uniform',
-    'triangular',
-    'lognormal',
-    'gamma'
-]
-
-def find_best_fit_distribution(observed_values, N=None, remove_outliers=False) -> Dict[str, Any]:
-    if remove_outliers:
-        q1 = np.percentile(observed_values, 25)
-        q3 = np.percentile(observed_values, 75)
-        iqr = q3 - q1
-        lower_limit = q1 - 1.5 * iqr
-        upper_limit = q3 + 1.5 * iqr
-        observed_values = observed_values[(observed_values >= lower_limit) & (observed_values <= upper_limit)]
-    
-    if not N:
-        N = len(observed_values)
-
-    generated_values = dict()
-    distr_params = {d: dict() for d in possible_distributions}
-
-    if np.min(observed_values) == np.max(observed_values):
-        return {
-            "arrival_time_distribution": {
-                "distribution_name": 'fixed',
-                "distribution_params": [{"value": np.mean(observed_values)}]
-            }
-        }
-
-    for distr_name in possible_distributions:
-        try:
-            if distr_name == 'fixed':
-                distr_params[distr_name] = {'value': np.mean(observed_values)}
-                generated_values[distr_name] = np.array([distr_params[distr_name]['value']] * N)
-            elif distr_name == 'normal':
-                dist = stats.norm
-                loc, scale = dist.fit(observed_values)
-                distr_params[distr_name] = {'loc': loc, 'scale': scale}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'exponential':
-                dist = stats.expon
-                loc, scale = dist.fit(observed_values)
-                distr_params[distr_name] = {'loc': loc, 'scale': scale}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'uniform':
-                dist = stats.uniform
-                loc, scale = dist.fit(observed_values)
-                distr_params[distr_name] = {'loc': loc, 'scale': scale}
-                generated_values[distr_name] = dist.rvs(loc=loc, scale=scale, size=N)
-            elif distr_name == 'triangular':
-                dist = stats.triang
-                c, loc, scale = dist.fit(observed_values)
-                distr_params[distr_name] = {'c': c, 'loc': loc, 'scale': scale}
-                generated_values[distr_name] = dist.rvs(c=c, loc=loc, scale=scale, size=N)
-            elif distr_name == 'lognormal':
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", RuntimeWarning)
-                    dist = stats.lognorm
-                    s, loc, scale = dist.fit(observed_values)
-                    distr_params[distr_name] = {'s': s, 'loc': loc, 'scale': scale}
-                    generated_values[distr_name] = dist.rvs(s=s, loc=loc, scale=scale, size=N)
-            elif distr_name == 'gamma':
-                dist = stats.gamma
-                a, loc, scale = dist.fit(observed_values)
-                distr_params[distr_name] = {'a': a, 'loc': loc, 'scale': scale}
-                generated_values[distr_name] = dist.rvs(a=a, loc=loc, scale=scale, size=N)
-        except Exception as e:
-            print(f"An error occurred while fitting distribution {distr_name}: {e}")
-            continue
-
-    wass_distances = {d_name: stats.wasserstein_distance(observed_values, generated_values[d_name]) for d_name in possible_distributions if d_name in generated_values}
-    best_distr = min(wass_distances, key=wass_distances.get)
-
-    distr_params_list = [{"value": value} for value in distr_params[best_distr].values()]
+def find_best_fit_distribution(observed_values, **fit_options) -> Dict[str, Any]:
+    best_distr, params, _, _, sampling_info = best_fit_distribution(observed_values, **fit_options)
+
+    distr_params_list = [{"value": value} for value in params.values()]
+
+    arrival_time_distribution = {
+        "distribution_name": best_distr,
+        "distribution_params": distr_params_list
+    }
+    if sampling_info is not None:
+        arrival_time_distribution["sampling"] = sampling_info
 
     return {
-        "arrival_time_distribution": {
-            "distribution_name": best_distr,
-            "distribution_params": distr_params_list
-        }
+        "arrival_time_distribution": arrival_time_distribution
     }
 
-def compute_inter_arrival_times(log) -> list:
-    inter_arrival_times = []
+CASE_STARTS = ['start', 'first']
+ARRIVAL_MODELS = ['stationary', 'calendar']
+CALENDAR_FITS = ['poisson', 'best']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+NAT = np.iinfo(np.int64).min
+NO_START = np.iinfo(np.int64).max
+
+def case_start_times(log, case_start='start'):
+    """
+    Start of every case: its earliest event (`case_start='first'`) or its
+    earliest 'start' event ('start'), falling back to its earliest event for
+    cases without 'start' events, e.g. in logs of complete events only.
+
+    output: (case ids, start times in ns)
+    """
+    case_ids = []
     start_times = []
-    
-    for trace in log:
-        for event in trace:
-            if event['lifecycle:transition'] == 'start':
-                start_times.append(event['time:timestamp'])
-                break
-
-    start_times.sort()
-
-    for i in range(1, len(start_times)):
-        time_1 = start_times[i]
-        time_0 = start_times[i - 1]
-        inter_arrival_times.append((time_1 - time_0).total_seconds())
-    
-    return inter_arrival_times
-
-def find_inter_arrival_distribution(log) -> Dict[str, Any]:
-    inter_arrival_times = compute_inter_arrival_times(log)
-    return find_best_fit_distribution(inter_arrival_times)
+
+    # Cases never span two batches, so the start of a case is found within one batch
+    for table in iter_event_tables(log):
+        codes = table[CASE_ID].cat.codes.to_numpy()
+        timestamps = table[TIMESTAMP].to_numpy()
+        known = (codes >= 0) & (timestamps != NAT)
+        codes, timestamps = codes[known], timestamps[known]
+
+        first = np.full(len(table[CASE_ID].cat.categories), NO_START, dtype=np.int64)
+        np.minimum.at(first, codes, timestamps)
+        if case_start == 'start':
+            is_start = (table[LIFECYCLE] == 'start').to_numpy()[known]
+            first_start = np.full(len(first), NO_START, dtype=np.int64)
+            np.minimum.at(first_start, codes[is_start], timestamps[is_start])
+            first = np.where(first_start != NO_START, first_start, first)
+
+        present = first != NO_START
+        case_ids.append(table[CASE_ID].cat.categories.to_numpy(dtype=object)[present])
+        start_times.append(first[present])
+
+    if not start_times:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    return np.concatenate(case_ids), np.concatenate(start_times)
+
+def compute_inter_arrival_times(log, case_start='start') -> np.ndarray:
+    """
+    output: the gaps between consecutive case starts in seconds
+    """
+    _, start_times = case_start_times(log, case_start)
+    return np.diff(np.sort(start_times)) / 1e9
+
+def _exponential(rate):
+    """
+    Inter-arrival distribution of a Poisson process with `rate` arrivals per hour.
+    """
+    return {
+        "distribution_name": "exponential",
+        "distribution_params": [{"value": 0.0}, {"value": 3600 / rate}],
+    }
+
+def arrival_calendar(start_times, calendar_fit='poisson', timezone='UTC', workers=None, **fit_options) -> List[Dict[str, Any]]:
+    """
+    Arrival rates per weekday and hour of day (in `timezone`) of the sorted
+    case `start_times` (ns). The rate of a bin is the number of cases that
+    arrived in it divided by the number of times the bin occurs in the span
+    of the log, i.e. a piecewise-constant Poisson process. With
+    `calendar_fit='best'`, the gaps that start in a bin are fitted like the
+    stationary inter-arrival times instead, the bins by `workers` processes
+    (see `miner_common.parallel`).
+
+    output: [{"day": WEEKDAY, "hour": HOUR, "cases": N, "rate": CASES PER HOUR,
+              "arrival_time_distribution": {...} or None for bins without arrivals}]
+    """
+    if len(start_times) == 0:
+        return []
+    # Local wall-clock times, the hours of zones with offsets like +05:30 do not start on UTC hours
+    times = pd.DatetimeIndex(start_times.view('datetime64[ns]')).tz_localize('UTC').tz_convert(timezone).tz_localize(None)
+    bins = (times.dayofweek * 24 + times.hour).to_numpy()
+    cases = np.bincount(bins, minlength=7 * 24)
+
+    # Every local hour of the span, so every bin with arrivals has exposure (DST changes shift one hour a year)
+    hours = pd.date_range(times[0].floor('h'), times[-1].floor('h'), freq='h')
+    exposure = np.bincount((hours.dayofweek * 24 + hours.hour).to_numpy(), minlength=7 * 24)
+    rates = np.divide(cases, exposure, out=np.zeros(7 * 24), where=exposure > 0)
+
+    fitted = dict()
+    if calendar_fit == 'best':
+        gaps = np.diff(start_times) / 1e9
+        gap_bins = bins[:-1]
+        order = np.argsort(gap_bins, kind='stable')
+        bounds = np.searchsorted(gap_bins[order], np.arange(7 * 24 + 1))
+        samples = {b: gaps[order[bounds[b]:bounds[b + 1]]] for b in range(7 * 24) if bounds[b + 1] - bounds[b] >= 2}
+        fitted = fit_samples(find_best_fit_distribution, samples, workers, **fit_options)
+
+    calendar = []
+    for b in range(7 * 24):
+        if b in fitted:
+            distribution = fitted[b]["arrival_time_distribution"]
+        else:
+            distribution = _exponential(rates[b]) if rates[b] > 0 else None
+        calendar.append({
+            "day": WEEKDAYS[b // 24],
+            "hour": b % 24,
+            "cases": int(cases[b]),
+            "rate": float(rates[b]),
+            "arrival_time_distribution": distribution,
+        })
+    return calendar
+
+def find_inter_arrival_distribution(log, case_start='start', arrival_model='stationary', calendar_fit='poisson', timezone='UTC',
+                                    workers=None, **fit_options) -> Dict[str, Any]:
+    """
+    `log` may also be a batch iterator from `iter_event_batches`.
+    `fit_options` (fit_mode, score, seed, max_samples, sampling) are passed on to
+    `find_best_fit_distribution`. With `arrival_model='calendar'`, the result
+    also holds the weekday x hour `arrival_calendar` (see `arrival_calendar`).
+    """
+    _, start_times = case_start_times(log, case_start)
+    start_times = np.sort(start_times)
+    result = find_best_fit_distribution(np.diff(start_times) / 1e9, **fit_options)
+    if arrival_model == 'calendar':
+        result["arrival_calendar"] = arrival_calendar(start_times, calendar_fit, timezone, workers, **fit_options)
+    return result
+
+def inter_arrival_options_from_args(args):
+    """
+    Fit options, `case_start`, `arrival_model`, `calendar_fit`, `timezone` and
+    `workers` from the query arguments of a request. Raises ValueError for
+    invalid values.
+    """
+    options = fit_options_from_args(args)
+    if 'case_start' in args:
+        if args['case_start'] not in CASE_STARTS:
+            raise ValueError(f'Invalid case_start. Expected one of {CASE_STARTS}')
+        options['case_start'] = args['case_start']
+    if 'arrival_model' in args:
+        if args['arrival_model'] not in ARRIVAL_MODELS:
+            raise ValueError(f'Invalid arrival_model. Expected one of {ARRIVAL_MODELS}')
+        options['arrival_model'] = args['arrival_model']
+    if 'calendar_fit' in args:
+        if args['calendar_fit'] not in CALENDAR_FITS:
+            raise ValueError(f'Invalid calendar_fit. Expected one of {CALENDAR_FITS}')
+        options['calendar_fit'] = args['calendar_fit']
+    if 'timezone' in args:
+        try:
+            zoneinfo.ZoneInfo(args['timezone'])
+        except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+            raise ValueError('Invalid timezone. Expected an IANA time zone name, e.g. Europe/Berlin')
+        options['timezone'] = args['timezone']
+    workers = workers_from_args(args)
+    if workers is not None:
+        options['workers'] = workers
+    return options
+
+class InterArrivalState:
+    """
+    Sufficient statistics of the inter-arrival times of a growing log (see
+    `miner_common.sessions`): a SampleStats of the inter-arrival times, the
+    start of the cases counted within the session horizon and the last case
+    start. Deltas are expected in time order; a case starting before the last
+    known case start is counted with an inter-arrival time of 0.
+    """
+
+    def __init__(self):
+        self.stats = SampleStats(seed=DEFAULT_SEED)
+        self.started_cases = dict()
+        self.last_start = None
+
+    def update(self, log, case_start='start'):
+        case_ids, start_times = case_start_times(log, case_start)
+        new = np.array([case_id not in self.started_cases for case_id in case_ids], dtype=bool)
+        order = np.argsort(start_times[new], kind='stable')
+        case_ids, start_times = case_ids[new][order], start_times[new][order]
+        # In order of their start, as far as the deltas are in time order
+        self.started_cases.update(zip(case_ids, start_times.tolist()))
+        if len(start_times) == 0:
+            return
+
+        if self.last_start is not None:
+            start_times = np.maximum(np.r_[self.last_start, start_times], self.last_start)
+        self.stats.update(np.diff(start_times) / 1e9)
+        self.last_start = int(start_times[-1])
+
+        horizon = session_horizon()
+        if horizon is not None:
+            cutoff = self.last_start - horizon
+            expired = []
+            for case_id, start in self.started_cases.items():
+                if start >= cutoff:
+                    break
+                expired.append(case_id)
+            for case_id in expired:
+                del self.started_cases[case_id]
+
+    def result(self, **fit_options):
+        return find_best_fit_distribution(self.stats.sample, sketch=self.stats.sketch, summary=self.stats.summary(),
+                                          **fit_options)
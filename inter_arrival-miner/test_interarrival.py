@@ -0,0 +1,38 @@
+"""
+Regression tests for the state of the session endpoints.
+
+Run from the inter_arrival-miner directory (with the repository root on the path):
+    PYTHONPATH=.. python -m pytest -q test_interarrival.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from miner_common.event_log import CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE, TIMESTAMP
+from interarrival import InterArrivalState
+
+
+def start_events(cases, minutes):
+    return pd.DataFrame({
+        CASE_ID: pd.Categorical(cases),
+        ACTIVITY: pd.Categorical(['A'] * len(cases)),
+        RESOURCE: pd.Categorical(['R1'] * len(cases)),
+        LIFECYCLE: pd.Categorical(['start'] * len(cases)),
+        TIMESTAMP: pd.Timestamp('2024-01-01').value + np.asarray(minutes, dtype=np.int64) * 60 * 10**9,
+    })
+
+
+def test_session_counts_every_case_once():
+    state = InterArrivalState()
+    state.update(start_events(['1', '2'], [0, 10]))
+    state.update(start_events(['2', '3'], [15, 30]))
+    assert state.stats.n == 2
+    assert state.stats.mean == 15 * 60
+
+
+def test_session_forgets_cases_started_before_the_horizon(monkeypatch):
+    monkeypatch.setenv('MINER_SESSION_HORIZON', '3600')
+    state = InterArrivalState()
+    state.update(start_events(['1', '2', '3'], [0, 50, 100]))
+    state.update(start_events(['4'], [200]))
+    assert list(state.started_cases) == ['4']
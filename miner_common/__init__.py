@@ -0,0 +1,5 @@
+"""
+Code shared by the Flask miner services (inductive, resource, activity-duration
+and inter-arrival miner). The services are built with the repository root as
+docker build context so that this package is copied next to each `api.py`.
+"""
@@ -0,0 +1,42 @@
+"""
+Helpers of the miners' benchmark scripts (benchmark_*.py), which compare a
+vectorized miner against the former per-trace or per-resource implementation
+on synthetic event tables.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from miner_common.event_log import CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE, TIMESTAMP
+
+
+def synthetic_table(n_cases, events_per_case=6, n_resources=50, seed=0):
+    """
+    Event table of `n_cases` cases arriving every 10 minutes on average, each
+    with `events_per_case` events 30 minutes apart that alternate between
+    'start' and 'complete' of an activity. Resources are drawn from
+    `n_resources`, with some events left without one; half of the timestamps
+    have a sub-second part.
+    """
+    rng = np.random.default_rng(seed)
+    n_events = n_cases * events_per_case
+    case_starts = pd.Timestamp('2024-01-01').value + np.cumsum(rng.exponential(600, n_cases)).astype(np.int64) * 10**9
+    offsets = np.tile(np.arange(events_per_case), n_cases) * 1800 * 10**9 + rng.integers(0, 2, n_events) * 250_000
+    return pd.DataFrame({
+        CASE_ID: pd.Categorical.from_codes(np.repeat(np.arange(n_cases), events_per_case), [str(i) for i in range(n_cases)]),
+        ACTIVITY: pd.Categorical.from_codes(np.tile(np.arange(events_per_case) // 2, n_cases), [f'A{i}' for i in range(events_per_case)]),
+        RESOURCE: pd.Categorical.from_codes(rng.integers(-1, n_resources, n_events), [f'R{i}' for i in range(n_resources)]),
+        LIFECYCLE: pd.Categorical.from_codes(np.tile(np.arange(events_per_case) % 2, n_cases), ['start', 'complete']),
+        TIMESTAMP: np.repeat(case_starts, events_per_case) + offsets,
+    })
+
+
+def timed(function, *args):
+    """
+    output: (result, seconds)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
@@ -0,0 +1,265 @@
+"""
+Columnar event-log table shared by the miner services.
+
+An uploaded XES log is parsed once into a pandas DataFrame with one row per
+event, in file order:
+
+    case_id     categorical   trace 'concept:name' (or the trace index)
+    activity    categorical   event 'concept:name'
+    resource    categorical   event 'org:resource' (NaN when absent)
+    lifecycle   categorical   event 'lifecycle:transition'
+    timestamp   int64         'time:timestamp' as nanoseconds since the epoch (UTC)
+
+Categories are kept in order of first appearance, so iterating over them
+reproduces the order in which the pm4py based implementation used to report
+activities and resources.
+"""
+
+import gzip
+import os
+import xml.etree.ElementTree as ET
+from array import array
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+CASE_ID = 'case_id'
+ACTIVITY = 'activity'
+RESOURCE = 'resource'
+LIFECYCLE = 'lifecycle'
+TIMESTAMP = 'timestamp'
+
+CATEGORICAL_COLUMNS = [CASE_ID, ACTIVITY, RESOURCE, LIFECYCLE]
+COLUMNS = CATEGORICAL_COLUMNS + [TIMESTAMP]
+
+DEFAULT_BATCH_SIZE = 100_000
+GZIP_MAGIC = b'\x1f\x8b'
+
+XES_KEYS = {
+    'concept:name': ACTIVITY,
+    'org:resource': RESOURCE,
+    'lifecycle:transition': LIFECYCLE,
+    'time:timestamp': TIMESTAMP,
+}
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _attributes(elem):
+    return {child.get('key'): child.get('value') for child in elem if child.get('key') is not None}
+
+
+class _Column:
+    """Interns string values into integer codes while the log is being read."""
+
+    def __init__(self):
+        self.codes = array('i')
+        self.categories = {}
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+        else:
+            self.codes.append(self.categories.setdefault(value, len(self.categories)))
+
+    def extend(self, value, count):
+        code = -1 if value is None else self.categories.setdefault(value, len(self.categories))
+        self.codes.extend([code] * count)
+
+    def to_categorical(self):
+        return pd.Categorical.from_codes(np.frombuffer(self.codes, dtype=np.int32), list(self.categories))
+
+
+class _TableBuilder:
+    """Collects the events of whole traces until they are turned into an event table."""
+
+    def __init__(self):
+        self.columns = {column: _Column() for column in CATEGORICAL_COLUMNS}
+        self.timestamps = []
+        self.trace_events = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add_event(self, attributes):
+        self.columns[ACTIVITY].append(attributes.get('concept:name'))
+        self.columns[RESOURCE].append(attributes.get('org:resource'))
+        self.columns[LIFECYCLE].append(attributes.get('lifecycle:transition', 'complete'))
+        self.timestamps.append(attributes.get('time:timestamp'))
+        self.trace_events += 1
+
+    def end_trace(self, case_id):
+        self.columns[CASE_ID].extend(case_id, self.trace_events)
+        self.trace_events = 0
+
+    def to_table(self):
+        table = pd.DataFrame({column: self.columns[column].to_categorical() for column in CATEGORICAL_COLUMNS})
+        table[TIMESTAMP] = parse_timestamps(self.timestamps)
+        return table
+
+
+def parse_timestamps(values):
+    """
+    Parse XES date strings into nanoseconds since the epoch (UTC).
+    """
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format='ISO8601')
+    return timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+@contextmanager
+def open_xes(source):
+    """
+    Open an XES log given as path or binary file object for reading, transparently
+    decompressing gzip (.xes.gz) input.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            with open_xes(file) as stream:
+                yield stream
+        return
+
+    if hasattr(source, 'peek'):
+        head = source.peek(2)[:2]
+    elif source.seekable():
+        position = source.tell()
+        head = source.read(2)
+        source.seek(position)
+    else:
+        head = b''
+
+    if head == GZIP_MAGIC:
+        with gzip.GzipFile(fileobj=source, mode='rb') as stream:
+            yield stream
+    else:
+        yield source
+
+
+def iter_event_batches(source, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream an XES log (path or binary file object, optionally gzip compressed) as
+    a sequence of event tables of about `batch_size` events each.
+
+    Batches always end at a trace boundary and parsed elements are released as
+    soon as they have been read, so memory use is bounded by the batch size and
+    not by the size of the log.
+    """
+    with open_xes(source) as stream:
+        builder = _TableBuilder()
+        event_defaults = {}
+        trace_index = 0
+
+        context = ET.iterparse(stream, events=('start', 'end'))
+        _, root = next(context)
+        depth = 0
+
+        for event, elem in context:
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            tag = _local_name(elem.tag)
+
+            if tag == 'global' and depth == 0 and elem.get('scope') == 'event':
+                event_defaults = {key: value for key, value in _attributes(elem).items() if key in XES_KEYS}
+            elif tag == 'event' and depth == 1:
+                builder.add_event({**event_defaults, **_attributes(elem)})
+                elem.clear()
+            elif tag == 'trace' and depth == 0:
+                builder.end_trace(_attributes(elem).get('concept:name', str(trace_index)))
+                trace_index += 1
+                elem.clear()
+                root.clear()
+
+                if len(builder) >= batch_size:
+                    yield builder.to_table()
+                    builder = _TableBuilder()
+
+        if len(builder) > 0:
+            yield builder.to_table()
+
+
+def concat_event_tables(tables):
+    """
+    Concatenate event tables, merging their categories in order of first appearance.
+    """
+    tables = list(tables)
+    if not tables:
+        return _TableBuilder().to_table()
+    if len(tables) == 1:
+        return tables[0]
+
+    return pd.DataFrame({
+        **{column: union_categoricals([table[column] for table in tables]) for column in CATEGORICAL_COLUMNS},
+        TIMESTAMP: np.concatenate([table[TIMESTAMP].to_numpy() for table in tables]),
+    })
+
+
+def read_event_table(source):
+    """
+    Parse an XES log (path or binary file object, optionally gzip compressed)
+    into a single event table.
+    """
+    return concat_event_tables(iter_event_batches(source))
+
+
+def iter_event_tables(log):
+    """
+    Iterate over `log` as event tables. `log` is either a batch iterator as
+    returned by `iter_event_batches` or anything accepted by `as_event_table`.
+    """
+    if isinstance(log, Iterator):
+        yield from log
+    else:
+        yield as_event_table(log)
+
+
+def as_event_table(log):
+    """
+    Return `log` as an event table. Accepts an event table, a pm4py EventLog or
+    a pm4py formatted DataFrame.
+    """
+    if isinstance(log, pd.DataFrame) and TIMESTAMP in log.columns and CASE_ID in log.columns:
+        return log
+
+    if not isinstance(log, pd.DataFrame):
+        import pm4py
+        log = pm4py.convert_to_dataframe(log)
+
+    times = pd.to_datetime(log['time:timestamp'], utc=True)
+
+    def categorical(column, default=None):
+        values = log[column] if column in log.columns else pd.Series(default, index=log.index)
+        return pd.Categorical(values, categories=pd.unique(values.dropna()))
+
+    return pd.DataFrame({
+        CASE_ID: categorical('case:concept:name'),
+        ACTIVITY: categorical('concept:name'),
+        RESOURCE: categorical('org:resource'),
+        LIFECYCLE: categorical('lifecycle:transition', 'complete'),
+        TIMESTAMP: times.to_numpy(dtype='datetime64[ns]').view(np.int64),
+    }).reset_index(drop=True)
+
+
+def event_times(table):
+    """
+    Event timestamps as timezone naive UTC datetimes.
+    """
+    return pd.Series(table[TIMESTAMP].to_numpy().view('datetime64[ns]'), index=table.index)
+
+
+def to_pm4py_dataframe(table):
+    """
+    Convert an event table into the DataFrame layout expected by pm4py.
+    """
+    return pd.DataFrame({
+        'case:concept:name': table[CASE_ID].astype(str),
+        'concept:name': table[ACTIVITY].astype(str),
+        'org:resource': table[RESOURCE],
+        'lifecycle:transition': table[LIFECYCLE],
+        'time:timestamp': pd.to_datetime(table[TIMESTAMP].to_numpy(), utc=True),
+    })
@@ -0,0 +1,385 @@
+"""
+Distribution fitting shared by the activity-duration and inter-arrival miners.
+
+fit_mode 'fast' (default) estimates parameters in closed form where the
+maximum likelihood estimate has one (normal, exponential, uniform, fixed),
+with the method of moments for the triangular distribution and with the
+profile likelihood of a lognormal / gamma (log-moments, Newton iterations on
+the digamma equation) at a few locations between 0 and just below the sample
+minimum, refined by a bounded 1-D search on the location, keeping the one
+closest to the sample in Wasserstein-1 distance.
+fit_mode 'mle' uses scipy's
+generic numerical `.fit` for every candidate, which is slower but also
+optimises the location of the triangular, lognormal and gamma candidates.
+
+Candidates are ranked by `score` (lower is better):
+    wasserstein  Wasserstein-1 distance between the sample and the fitted
+                 distribution, from the sorted sample against the fitted
+                 quantile function at the midpoints of the n empirical
+                 quantile steps (default)
+    ks           Kolmogorov-Smirnov statistic against the fitted CDF
+    aic          Akaike information criterion of the fitted density
+    sampled      Wasserstein-1 distance to N variates drawn from the fitted
+                 distribution with a seeded generator (the former behaviour)
+
+With `max_samples`, larger samples are fitted on a reservoir or stratified
+subsample of that size and scored against the quantiles of a KLL sketch of
+the complete sample (see `subsample`).
+"""
+
+import warnings
+
+import numpy as np
+from scipy import optimize, special, stats
+
+from miner_common.sketch import SAMPLING_METHODS, midpoint_quantiles, reservoir_sample, sketch_values, stratified_sample
+
+possible_distributions = [
+    'fixed',
+    'normal',
+    'exponential',
+    'uniform',
+    'triangular',
+    'lognormal',
+    'gamma'
+]
+
+FIT_MODES = ['fast', 'mle']
+SCORES = ['wasserstein', 'ks', 'aic', 'sampled']
+DEFAULT_SEED = 0
+SKETCH_K = 200
+SKETCH_GRID_SIZE = 1000
+
+SCIPY_DISTRIBUTIONS = {
+    'normal': stats.norm,
+    'exponential': stats.expon,
+    'uniform': stats.uniform,
+    'triangular': stats.triang,
+    'lognormal': stats.lognorm,
+    'gamma': stats.gamma,
+}
+
+# Names of the parameters in the order scipy expects them
+SCIPY_PARAMS = {
+    'normal': ['loc', 'scale'],
+    'exponential': ['loc', 'scale'],
+    'uniform': ['loc', 'scale'],
+    'triangular': ['c', 'loc', 'scale'],
+    'lognormal': ['s', 'loc', 'scale'],
+    'gamma': ['a', 'loc', 'scale'],
+}
+
+
+def sample_summary(values):
+    """
+    Statistics of a sample that every candidate needs, computed once.
+    """
+    q75, q25 = np.percentile(values, [75, 25])
+    return {
+        'n': len(values),
+        'mean': np.mean(values),
+        'std': np.std(values),
+        'min': np.min(values),
+        'max': np.max(values),
+        'q25': q25,
+        'q75': q75,
+        'iqr': q75 - q25,
+    }
+
+
+LOCATION_CANDIDATES = 5
+LOCATION_QUANTILES = 1000
+
+
+def _positive_shift(summary):
+    # Location just below the sample minimum, so every shifted value is strictly positive
+    return summary['min'] - 1e-3 * (summary['max'] - summary['min'])
+
+
+def _fit_location(distr_name, values, summary, fit_at):
+    # Profile fit at evenly spaced locations from 0 (when the sample is positive) up to just
+    # below the minimum, refined by a bounded search around the best of them in
+    # Wasserstein-1 distance to the sample, taken on at most LOCATION_QUANTILES order statistics
+    sorted_values = np.sort(values)
+    n = len(sorted_values)
+    steps = np.unique(np.linspace(0, n - 1, min(n, LOCATION_QUANTILES)).astype(int))
+    quantiles, levels = sorted_values[steps], (steps + 0.5) / n
+
+    def fit(loc):
+        params = fit_at(sorted_values - loc, summary['mean'] - loc)
+        params['loc'] = float(loc)
+        return params
+
+    def distance(loc):
+        value = np.mean(np.abs(quantiles - frozen_distribution(distr_name, fit(loc)).ppf(levels)))
+        return value if np.isfinite(value) else np.inf
+
+    shift = _positive_shift(summary)
+    if shift <= 0:
+        return fit(shift)
+    locations = np.linspace(0, shift, LOCATION_CANDIDATES)
+    with np.errstate(all='ignore'):
+        distances = [distance(loc) for loc in locations]
+        best = int(np.argmin(distances))
+        refined = optimize.minimize_scalar(
+            distance, method='bounded', options={'xatol': 1e-3 * shift},
+            bounds=(locations[max(best - 1, 0)], locations[min(best + 1, LOCATION_CANDIDATES - 1)]),
+        )
+    loc = refined.x if refined.success and refined.fun < distances[best] else locations[best]
+    return fit(loc)
+
+
+def _fit_lognormal_at(shifted, mean):
+    log_values = np.log(shifted)
+    return {'s': np.std(log_values), 'loc': 0.0, 'scale': np.exp(np.mean(log_values))}
+
+
+def _fit_gamma_at(shifted, mean):
+    # Shape from the values, scale from the mean of the summary (the same unless the values are a subsample)
+    a = _fit_gamma_shape(np.log(np.mean(shifted)), np.mean(np.log(shifted)))
+    return {'a': a, 'loc': 0.0, 'scale': mean / a}
+
+
+def _fit_gamma_shape(log_mean, mean_log, tol=1e-10, max_iter=20):
+    # Newton on log(a) - digamma(a) = log(mean) - mean(log), started from Minka's approximation
+    s = log_mean - mean_log
+    a = (3 - s + np.sqrt((s - 3) ** 2 + 24 * s)) / (12 * s)
+    for _ in range(max_iter):
+        step = (np.log(a) - special.digamma(a) - s) / (1 / a - special.polygamma(1, a))
+        a = max(a - step, a / 10)
+        if abs(step) < tol * a:
+            break
+    return a
+
+
+def fit_fast(distr_name, values, summary):
+    if distr_name == 'fixed':
+        return {'value': summary['mean']}
+    if distr_name == 'normal':
+        return {'loc': summary['mean'], 'scale': summary['std']}
+    if distr_name == 'exponential':
+        return {'loc': summary['min'], 'scale': summary['mean'] - summary['min']}
+    if distr_name == 'uniform':
+        return {'loc': summary['min'], 'scale': summary['max'] - summary['min']}
+    if distr_name == 'triangular':
+        scale = summary['max'] - summary['min']
+        c = (3 * summary['mean'] - 2 * summary['min'] - summary['max']) / scale
+        return {'c': float(np.clip(c, 0, 1)), 'loc': summary['min'], 'scale': scale}
+    if distr_name == 'lognormal':
+        return _fit_location(distr_name, values, summary, _fit_lognormal_at)
+    if distr_name == 'gamma':
+        return _fit_location(distr_name, values, summary, _fit_gamma_at)
+    raise ValueError(f'Unknown distribution: {distr_name}')
+
+
+def fit_mle(distr_name, values, summary):
+    if distr_name == 'fixed':
+        return {'value': summary['mean']}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        fitted = SCIPY_DISTRIBUTIONS[distr_name].fit(values)
+    return dict(zip(SCIPY_PARAMS[distr_name], fitted))
+
+
+def fit_distributions(values, summary, fit_mode='fast'):
+    """
+    Fit every candidate of `possible_distributions` to `values`.
+
+    output: {DISTRNAME: {PARAM: VALUE}} with parameters in scipy order,
+    candidates that cannot be fitted are left out.
+    """
+    if fit_mode not in FIT_MODES:
+        raise ValueError(f'Unknown fit mode: {fit_mode}, expected one of {FIT_MODES}')
+    fit = fit_fast if fit_mode == 'fast' else fit_mle
+
+    fitted = dict()
+    for distr_name in possible_distributions:
+        try:
+            params = fit(distr_name, values, summary)
+            if not all(np.isfinite(v) for v in params.values()):
+                raise ValueError(f'non-finite parameters {params}')
+            fitted[distr_name] = params
+        except Exception as e:
+            print(f"An error occurred while fitting distribution {distr_name}: {e}")
+    return fitted
+
+
+def generate_values(distr_name, params, size, random_state=None):
+    if distr_name == 'fixed':
+        return np.full(size, params['value'])
+    return SCIPY_DISTRIBUTIONS[distr_name].rvs(**params, size=size, random_state=random_state)
+
+
+def frozen_distribution(distr_name, params):
+    return SCIPY_DISTRIBUTIONS[distr_name](**params)
+
+
+def _wasserstein(sorted_values, distr_name, params):
+    n = len(sorted_values)
+    if distr_name == 'fixed':
+        return np.mean(np.abs(sorted_values - params['value']))
+    quantiles = frozen_distribution(distr_name, params).ppf((np.arange(n) + 0.5) / n)
+    return np.mean(np.abs(sorted_values - quantiles))
+
+
+def _kolmogorov_smirnov(sorted_values, distr_name, params):
+    n = len(sorted_values)
+    if distr_name == 'fixed':
+        cdf = (sorted_values >= params['value']).astype(float)
+    else:
+        cdf = frozen_distribution(distr_name, params).cdf(sorted_values)
+    steps = np.arange(n + 1) / n
+    return max(np.max(steps[1:] - cdf), np.max(cdf - steps[:-1]))
+
+
+def _aic(sorted_values, distr_name, params):
+    if distr_name == 'fixed':
+        return np.inf
+    log_likelihood = np.sum(frozen_distribution(distr_name, params).logpdf(sorted_values))
+    return 2 * len(params) - 2 * log_likelihood
+
+
+def score_distributions(values, fitted, score='wasserstein', N=None, seed=None):
+    """
+    Goodness of fit of every fitted candidate, lower is better.
+
+    output: {DISTRNAME: SCORE}
+    """
+    if score not in SCORES:
+        raise ValueError(f'Unknown score: {score}, expected one of {SCORES}')
+
+    if score == 'sampled':
+        random_state = np.random.default_rng(DEFAULT_SEED if seed is None else seed)
+        scores = dict()
+        for distr_name, params in fitted.items():
+            try:
+                generated = generate_values(distr_name, params, N or len(values), random_state)
+                scores[distr_name] = stats.wasserstein_distance(values, generated)
+            except Exception as e:
+                print(f"An error occurred while sampling distribution {distr_name}: {e}")
+        return scores
+
+    distance = {'wasserstein': _wasserstein, 'ks': _kolmogorov_smirnov, 'aic': _aic}[score]
+    sorted_values = np.sort(values)
+    scores = dict()
+    with np.errstate(all='ignore'):
+        for distr_name, params in fitted.items():
+            value = distance(sorted_values, distr_name, params)
+            scores[distr_name] = value if np.isfinite(value) else np.inf
+    return scores
+
+
+def sketch_scoring(sample, sketch, sampling='reservoir'):
+    """
+    Grid of quantiles of the complete sample summarized by `sketch` to score
+    the fit of its subsample `sample` on.
+
+    output: (sorted quantile grid, sampling info for the response)
+    """
+    q = midpoint_quantiles(SKETCH_GRID_SIZE)
+    grid = sketch.quantiles(q)
+    return grid, {
+        'sample_size': len(sample),
+        'observed_size': sketch.n,
+        'method': sampling,
+        # Wasserstein-1 distance between the subsample and the complete sample (seconds)
+        'sample_error': float(np.mean(np.abs(np.quantile(sample, q) - grid))),
+        # Normalized rank error of the quantiles the fit is scored on
+        'rank_error': sketch.rank_error(),
+    }
+
+
+def subsample(values, max_samples, sampling='reservoir', seed=None):
+    """
+    Reduce `values` to a subsample of `max_samples` values to fit on and a grid
+    of quantiles of the complete sample to score on.
+
+    output: (sample, sorted quantile grid, sampling info for the response)
+    """
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(f'Unknown sampling method: {sampling}, expected one of {SAMPLING_METHODS}')
+    seed = DEFAULT_SEED if seed is None else seed
+
+    if sampling == 'reservoir':
+        sample = reservoir_sample(values, max_samples, seed)
+    else:
+        sample = stratified_sample(values, max_samples, seed)
+
+    grid, sampling_info = sketch_scoring(sample, sketch_values(values, SKETCH_K, seed), sampling)
+    return sample, grid, sampling_info
+
+
+def best_fit_distribution(observed_values, N=None, remove_outliers=False, fit_mode='fast', score='wasserstein', seed=None,
+                          max_samples=None, sampling='reservoir', sketch=None, summary=None):
+    """
+    Fit every candidate to `observed_values` and pick the best by `score`.
+    When `observed_values` is only a sample of the values, `sketch` is the KLL
+    sketch and `summary` the exact `sample_summary` of all of them (see
+    SampleStats), so that scores, location, scale and the reported statistics
+    are those of the complete sample.
+
+    output: (DISTRNAME, {PARAM: VALUE}, {DISTRNAME: SCORE}, summary, sampling info or None)
+    """
+    observed_values = np.asarray(observed_values, dtype=float)
+    if remove_outliers:
+        summary = sample_summary(observed_values)
+        lower_limit = summary['q25'] - 1.5 * summary['iqr']
+        upper_limit = summary['q75'] + 1.5 * summary['iqr']
+        observed_values = observed_values[(observed_values >= lower_limit) & (observed_values <= upper_limit)]
+        summary = None
+
+    sampling_info = None
+    score_values = observed_values
+    if sketch is not None and sketch.n > len(observed_values):
+        score_values, sampling_info = sketch_scoring(observed_values, sketch)
+    elif max_samples and len(observed_values) > max_samples:
+        # Location, scale and the reported statistics come from the complete sample, only shapes from the subsample
+        if summary is None:
+            summary = sample_summary(observed_values)
+        observed_values, score_values, sampling_info = subsample(observed_values, max_samples, sampling, seed)
+
+    if not N:
+        N = len(observed_values)
+
+    if summary is None:
+        summary = sample_summary(observed_values)
+    if summary['min'] == summary['max']:
+        return 'fixed', {'value': summary['mean']}, {'fixed': 0.0}, summary, sampling_info
+
+    distr_params = fit_distributions(observed_values, summary, fit_mode)
+    scores = score_distributions(score_values, distr_params, score, N=N, seed=seed)
+    best_distr = min(scores, key=scores.get)
+    return best_distr, distr_params[best_distr], scores, summary, sampling_info
+
+
+def fit_options_from_args(args):
+    """
+    Fit options (`fit_mode`, `score`, `seed`, `max_samples`, `sampling`) from
+    the query arguments of a request. Raises ValueError for invalid values.
+    """
+    options = dict()
+    if 'fit_mode' in args:
+        if args['fit_mode'] not in FIT_MODES:
+            raise ValueError(f'Invalid fit_mode. Expected one of {FIT_MODES}')
+        options['fit_mode'] = args['fit_mode']
+    if 'score' in args:
+        if args['score'] not in SCORES:
+            raise ValueError(f'Invalid score. Expected one of {SCORES}')
+        options['score'] = args['score']
+    if 'seed' in args:
+        try:
+            options['seed'] = int(args['seed'])
+        except ValueError:
+            raise ValueError('Invalid seed. Expected an integer')
+    if 'max_samples' in args:
+        try:
+            options['max_samples'] = int(args['max_samples'])
+        except ValueError:
+            options['max_samples'] = 0
+        if options['max_samples'] < 2:
+            raise ValueError('Invalid max_samples. Expected an integer of at least 2')
+    if 'sampling' in args:
+        if args['sampling'] not in SAMPLING_METHODS:
+            raise ValueError(f'Invalid sampling. Expected one of {SAMPLING_METHODS}')
+        options['sampling'] = args['sampling']
+    return options
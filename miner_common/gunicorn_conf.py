@@ -0,0 +1,45 @@
+"""
+gunicorn configuration shared by the miner containers:
+
+    gunicorn -c miner_common/gunicorn_conf.py api:app
+
+Every worker is a separate process with its own interpreter, so concurrent
+requests neither share parser state nor serialise on the GIL. Uploads are
+parsed in memory and cached per content hash (see `log_cache`), so requests
+of different users never touch the same file.
+
+Configuration (environment):
+    MINER_BIND              address to listen on (default 0.0.0.0:8000)
+    MINER_WORKERS           worker processes (default: number of CPUs)
+    MINER_THREADS           threads per worker (default 1)
+    MINER_TIMEOUT           seconds a request may take before its worker is restarted (default 600)
+    MINER_GRACEFUL_TIMEOUT  seconds running requests get to finish on restart (default 30)
+    MINER_MAX_REQUESTS      requests after which a worker is recycled, 0 disables (default 200);
+                            workers that own running or queued jobs are not recycled until they finish
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('MINER_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MINER_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('MINER_THREADS', 1))
+timeout = int(os.environ.get('MINER_TIMEOUT', 600))
+graceful_timeout = int(os.environ.get('MINER_GRACEFUL_TIMEOUT', 30))
+
+# Recycling workers bounds the memory a worker can accumulate over many large logs
+max_requests = int(os.environ.get('MINER_MAX_REQUESTS', 200))
+max_requests_jitter = max_requests // 10
+
+# Heartbeat files on tmpfs, a container's overlay filesystem can block workers for seconds
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+
+
+def pre_request(worker, req):
+    # Runs before gunicorn counts the request, polls of a long job must not recycle the worker that runs it
+    from miner_common.jobs import owns_jobs
+    if owns_jobs():
+        worker.max_requests = max(worker.max_requests, worker.nr + 2)
@@ -0,0 +1,416 @@
+"""
+Asynchronous jobs for long-running mining requests, modelled on the discovery
+requests of simod_http:
+
+    POST   /jobs/<task>           store the upload, answer 202 with the job id
+    GET    /jobs/<job_id>         status of the job
+    GET    /jobs/<job_id>/result  result of a succeeded job
+    DELETE /jobs/<job_id>         cancel a queued or running job
+
+Jobs run in child processes of the worker that accepted them, at most
+MINER_JOB_WORKERS at a time. Up to MINER_JOB_QUEUE_SIZE further jobs wait in
+a queue, beyond that submissions are refused with 429. The state of a job is
+kept in a directory of its own below MINER_JOBS_DIR, so with several gunicorn
+workers any of them can answer the polls; cancellations of jobs owned by
+another worker are handed over through a marker file. A worker that owns
+running or queued jobs is not recycled after MINER_MAX_REQUESTS (see
+`owns_jobs` and the `pre_request` hook of gunicorn_conf), and terminates its
+jobs when it exits; jobs whose worker exited are reported as failed.
+
+Configuration (environment):
+    MINER_JOBS_DIR          directory of the job state (default: <tmp>/miner-jobs)
+    MINER_JOB_WORKERS       jobs run at the same time per worker (default 1)
+    MINER_JOB_QUEUE_SIZE    jobs waiting per worker before 429 (default 8)
+    MINER_JOB_EXPIRATION    seconds finished jobs are kept (default 3600)
+"""
+
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import Blueprint, Response, jsonify, request, url_for
+
+ACCEPTED = 'accepted'
+RUNNING = 'running'
+SUCCESS = 'success'
+FAILURE = 'failure'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = [SUCCESS, FAILURE, CANCELLED]
+
+STATUS_FILE = 'job.json'
+INPUT_FILE = 'input'
+RESULT_FILE = 'result'
+CANCEL_FILE = 'cancel'
+
+POLL_INTERVAL = 0.2
+CLEANUP_INTERVAL = 60
+RETRY_AFTER = 5
+
+JOB_ID_PATTERN = re.compile('[0-9a-f]{32}')
+
+
+# Job queues of this process, see `owns_jobs`
+_queues = []
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Task:
+    """
+    A mining request that can run as a job. `run(stream, args)` mines the
+    uploaded log and returns the response body; `validate(args)` raises
+    ValueError for invalid query arguments before the job is accepted.
+    """
+    run: Callable
+    validate: Optional[Callable] = None
+    mimetype: str = 'application/json'
+    filename: Optional[str] = None
+
+
+def _read_status(job_dir):
+    try:
+        return json.loads((job_dir / STATUS_FILE).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _update_status(job_dir, **changes):
+    status = _read_status(job_dir) or dict()
+    status.update(changes)
+    path = job_dir / STATUS_FILE
+    tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp_path.write_text(json.dumps(status))
+    os.replace(tmp_path, path)
+    return status
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _run_job(job_dir, task, args):
+    # The handlers inherited from a gunicorn worker would turn `terminate` into a graceful worker exit
+    for signum in [signal.SIGTERM, signal.SIGINT, signal.SIGQUIT]:
+        signal.signal(signum, signal.SIG_DFL)
+    try:
+        with open(job_dir / INPUT_FILE, 'rb') as stream:
+            result = task.run(stream, args)
+        if isinstance(result, str):
+            result = result.encode()
+        (job_dir / RESULT_FILE).write_bytes(result)
+        changes = {'job_status': SUCCESS}
+    except Exception as e:
+        logging.exception(f'Job {job_dir.name} failed')
+        changes = {'job_status': FAILURE, 'error': str(e)}
+    _update_status(job_dir, finished=time.time(), **changes)
+
+
+class JobQueue:
+    def __init__(self, jobs_dir, workers=1, max_queued=8, expiration=3600):
+        self.jobs_dir = Path(jobs_dir)
+        self.workers = workers
+        self.max_queued = max_queued
+        self.expiration = expiration
+        self._queue = deque()
+        self._running = dict()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._last_cleanup = 0.0
+        self._pid = os.getpid()
+
+        # Forked children inherit the task functions, nothing has to be pickled or re-imported
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('fork')
+        else:
+            self._context = multiprocessing.get_context()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            jobs_dir=os.environ.get('MINER_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'miner-jobs')),
+            workers=int(os.environ.get('MINER_JOB_WORKERS', 1)),
+            max_queued=int(os.environ.get('MINER_JOB_QUEUE_SIZE', 8)),
+            expiration=int(os.environ.get('MINER_JOB_EXPIRATION', 3600)),
+        )
+
+    def active(self):
+        """
+        Number of queued and running jobs of this worker.
+        """
+        with self._lock:
+            return len(self._queue) + len(self._running)
+
+    def shutdown(self):
+        """
+        Terminate the running jobs and fail the queued ones, e.g. when the worker exits.
+        """
+        # Forked job processes inherit the exit handlers of their worker
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            queued = [job_id for job_id, _ in self._queue]
+            running = list(self._running.items())
+            self._queue.clear()
+            self._running.clear()
+
+        for _, process in running:
+            process.terminate()
+        for job_id, process in running:
+            process.join()
+            self._finish(job_id, FAILURE, error='The worker running the job exited')
+        for job_id in queued:
+            self._finish(job_id, FAILURE, error='The worker running the job exited')
+
+    def _dir(self, job_id):
+        return self.jobs_dir / job_id
+
+    def submit(self, task_name, task, stream, args):
+        """
+        Store the upload `stream` and queue `task` on it. Raises QueueFull when
+        the queue of this worker is full.
+        """
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                raise QueueFull(f'{len(self._queue)} jobs are waiting already')
+
+        job_id = uuid.uuid4().hex
+        job_dir = self._dir(job_id)
+        job_dir.mkdir(parents=True)
+        with open(job_dir / INPUT_FILE, 'wb') as file:
+            shutil.copyfileobj(stream, file)
+        status = _update_status(
+            job_dir,
+            job_id=job_id,
+            task=task_name,
+            job_status=ACCEPTED,
+            created=time.time(),
+            owner=os.getpid(),
+            args=args,
+            mimetype=task.mimetype,
+            filename=task.filename,
+        )
+
+        with self._lock:
+            self._queue.append((job_id, task))
+            status['queue_position'] = len(self._queue)
+            self._ensure_dispatcher()
+        return status
+
+    def status(self, job_id):
+        """
+        output: {job_id, task, job_status, created, ...} or None for unknown jobs
+        """
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        job_dir = self._dir(job_id)
+        status = _read_status(job_dir)
+        if status is None:
+            return None
+
+        if status['job_status'] not in FINISHED_STATUSES and not _process_alive(status['owner']):
+            status = self._finish(job_id, FAILURE, error='The worker running the job exited')
+
+        with self._lock:
+            for position, (queued_id, _) in enumerate(self._queue):
+                if queued_id == job_id:
+                    status['queue_position'] = position + 1
+        return status
+
+    def result_path(self, job_id):
+        return self._dir(job_id) / RESULT_FILE
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job. Jobs of other workers are cancelled by
+        their owner on its next dispatch round.
+        """
+        status = self.status(job_id)
+        if status is None or status['job_status'] in FINISHED_STATUSES:
+            return status
+
+        with self._lock:
+            for entry in self._queue:
+                if entry[0] == job_id:
+                    self._queue.remove(entry)
+                    return self._finish(job_id, CANCELLED)
+            process = self._running.pop(job_id, None)
+
+        if process is not None:
+            process.terminate()
+            process.join()
+            return self._finish(job_id, CANCELLED)
+
+        (self._dir(job_id) / CANCEL_FILE).touch()
+        return status
+
+    def _finish(self, job_id, job_status, **changes):
+        job_dir = self._dir(job_id)
+        status = _read_status(job_dir)
+        # The job may have finished on its own in the meantime
+        if status is not None and status['job_status'] in FINISHED_STATUSES:
+            return status
+        return _update_status(job_dir, job_status=job_status, finished=time.time(), **changes)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            try:
+                self._reap()
+                self._start_queued()
+                if time.time() - self._last_cleanup > CLEANUP_INTERVAL:
+                    self._cleanup()
+                    self._last_cleanup = time.time()
+            except Exception as e:
+                logging.error(f'Job dispatcher error: {e}')
+            time.sleep(POLL_INTERVAL)
+
+    def _reap(self):
+        with self._lock:
+            running = list(self._running.items())
+
+        for job_id, process in running:
+            cancelled = (self._dir(job_id) / CANCEL_FILE).exists()
+            if cancelled and process.is_alive():
+                process.terminate()
+            if process.is_alive():
+                continue
+
+            process.join()
+            with self._lock:
+                self._running.pop(job_id, None)
+            if cancelled:
+                self._finish(job_id, CANCELLED)
+            else:
+                self._finish(job_id, FAILURE, error=f'The job process exited with code {process.exitcode}')
+
+    def _start_queued(self):
+        with self._lock:
+            while len(self._running) < self.workers and self._queue:
+                job_id, task = self._queue.popleft()
+                job_dir = self._dir(job_id)
+                if (job_dir / CANCEL_FILE).exists():
+                    self._finish(job_id, CANCELLED)
+                    continue
+
+                status = _update_status(job_dir, job_status=RUNNING, started=time.time())
+                # Not a daemon, tasks may fit in process pools of their own; `shutdown` terminates it
+                process = self._context.Process(target=_run_job, args=(job_dir, task, status['args']))
+                process.start()
+                self._running[job_id] = process
+
+    def _cleanup(self):
+        if not self.jobs_dir.exists():
+            return
+
+        now = time.time()
+        for job_dir in self.jobs_dir.iterdir():
+            status = _read_status(job_dir)
+            if status is None:
+                expired = job_dir.stat().st_mtime + self.expiration <= now
+            else:
+                expired = status['job_status'] in FINISHED_STATUSES and status['finished'] + self.expiration <= now
+            if expired:
+                logging.info(f'Removing expired job {job_dir.name}')
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def owns_jobs():
+    """
+    Whether this process has queued or running jobs, which would be lost if it exited.
+    """
+    return any(queue.active() for queue in _queues)
+
+
+def _status_response(status, status_code=200):
+    body = {key: status[key] for key in ['job_id', 'task', 'job_status', 'created', 'started', 'finished', 'error', 'queue_position'] if key in status}
+    body['result_url'] = url_for('jobs.read_job_result', job_id=status['job_id'], _external=True) if status['job_status'] == SUCCESS else None
+    return jsonify(body), status_code
+
+
+def job_blueprint(tasks, queue=None):
+    """
+    Flask blueprint with the job routes for `tasks` ({TASK NAME: Task}).
+    """
+    queue = JobQueue.from_env() if queue is None else queue
+    _queues.append(queue)
+    # Runs before multiprocessing's own exit handler, which would wait for the jobs to finish
+    atexit.register(queue.shutdown)
+    blueprint = Blueprint('jobs', __name__)
+
+    @blueprint.route('/jobs/<task_name>', methods=['POST'])
+    def create_job(task_name):
+        task = tasks.get(task_name)
+        if task is None:
+            return jsonify({'error': f'Unknown task: {task_name}, expected one of {list(tasks)}'}), 404
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': 'No file part'}), 400
+        if task.validate is not None:
+            try:
+                task.validate(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        try:
+            status = queue.submit(task_name, task, request.files['file'].stream, request.args.to_dict())
+        except QueueFull as e:
+            response = jsonify({'error': f'The job queue is full, retry later: {e}'})
+            response.headers['Retry-After'] = str(RETRY_AFTER)
+            return response, 429
+        return _status_response(status, 202)
+
+    @blueprint.route('/jobs/<job_id>', methods=['GET'])
+    def read_job(job_id):
+        status = queue.status(job_id)
+        if status is None:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+        return _status_response(status)
+
+    @blueprint.route('/jobs/<job_id>/result', methods=['GET'])
+    def read_job_result(job_id):
+        status = queue.status(job_id)
+        if status is None:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+        if status['job_status'] != SUCCESS:
+            return _status_response(status, 409)
+
+        headers = dict()
+        if status.get('filename'):
+            headers['Content-Disposition'] = f'attachment; filename="{status["filename"]}"'
+        return Response(queue.result_path(job_id).read_bytes(), mimetype=status['mimetype'], headers=headers)
+
+    @blueprint.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job(job_id):
+        status = queue.status(job_id)
+        if status is None:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+        if status['job_status'] in FINISHED_STATUSES:
+            return _status_response(status, 409)
+        return _status_response(queue.cancel(job_id))
+
+    return blueprint
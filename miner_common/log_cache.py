@@ -0,0 +1,294 @@
+"""
+Content-addressed cache of parsed event tables.
+
+SimuBridge uploads the very same log to every miner endpoint within seconds.
+Uploads are hashed (sha256 over the raw, possibly compressed, bytes) and the
+parsed event table is kept in an in-memory LRU that is bounded by the memory
+footprint of the cached tables. Only tables of up to MINER_LOG_CACHE_ENTRY_SIZE
+bytes are kept in memory, so a miss on a large upload still streams it in
+bounded batches. When a cache directory is configured, the batches are
+additionally written through to the disk as they are parsed, one Arrow IPC
+(feather) file per batch in a directory per upload, so the miner containers
+can share parses through a common volume and survive restarts, and disk
+hits are streamed batch by batch as well.
+
+Configuration (environment):
+    MINER_LOG_CACHE_SIZE        in-memory budget in bytes (default 512 MiB, 0 disables the cache)
+    MINER_LOG_CACHE_ENTRY_SIZE  largest table kept in memory in bytes (default 64 MiB, about 20 batches)
+    MINER_LOG_CACHE_DIR         directory of the on-disk store (default: no disk store)
+    MINER_LOG_CACHE_DISK_SIZE   on-disk budget in bytes (default 4 GiB)
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from miner_common.event_log import concat_event_tables, iter_event_batches
+
+CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_MEMORY_SIZE = 512 * 1024 * 1024
+DEFAULT_ENTRY_SIZE = 64 * 1024 * 1024
+DEFAULT_DISK_SIZE = 4 * 1024 * 1024 * 1024
+
+
+def _table_size(table):
+    return int(table.memory_usage(deep=True, index=False).sum())
+
+
+def hash_stream(stream):
+    """
+    sha256 hex digest of a seekable binary stream. The stream is rewound to where it started.
+    """
+    position = stream.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+class EventLogCache:
+    def __init__(self, max_size=DEFAULT_MEMORY_SIZE, cache_dir=None, max_disk_size=DEFAULT_DISK_SIZE,
+                 max_entry_size=DEFAULT_ENTRY_SIZE):
+        self.max_size = max_size
+        self.max_entry_size = min(max_entry_size, max_size)
+        self.max_disk_size = max_disk_size
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            try:
+                import pyarrow  # noqa: F401
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+            except (ImportError, OSError) as e:
+                logging.warning(f'Event log disk cache disabled: {e}')
+                self.cache_dir = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_size=int(os.environ.get('MINER_LOG_CACHE_SIZE', DEFAULT_MEMORY_SIZE)),
+            cache_dir=os.environ.get('MINER_LOG_CACHE_DIR'),
+            max_disk_size=int(os.environ.get('MINER_LOG_CACHE_DISK_SIZE', DEFAULT_DISK_SIZE)),
+            max_entry_size=int(os.environ.get('MINER_LOG_CACHE_ENTRY_SIZE', DEFAULT_ENTRY_SIZE)),
+        )
+
+    def _after_fork(self):
+        # A lock held by another thread of the parent would never be released in the child
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._tables),
+                'size': self._size,
+                'max_size': self.max_size,
+                'max_entry_size': self.max_entry_size,
+                'cache_dir': str(self.cache_dir) if self.cache_dir else None,
+            }
+
+    def get(self, key):
+        """
+        The cached table of `key`, from memory or disk, or None.
+        """
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return table
+
+        parts = self._parts(key)
+        if parts is None:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return concat_event_tables(self._remember_batches(key, self._load(key, parts)))
+
+    def read_event_table(self, stream):
+        """
+        Cached counterpart of `event_log.read_event_table` for an uploaded file stream.
+        """
+        return concat_event_tables(self.iter_event_batches(stream))
+
+    def iter_event_batches(self, stream, batch_size=None):
+        """
+        Cached counterpart of `event_log.iter_event_batches`. On a memory hit
+        the whole cached table is yielded as a single batch, on a disk hit the
+        stored batches are read one by one; on a miss the upload is streamed
+        and its batches are written through to the disk store.
+        """
+        kwargs = {} if batch_size is None else {'batch_size': batch_size}
+        if not self.enabled or not stream.seekable():
+            return iter_event_batches(stream, **kwargs)
+
+        key = hash_stream(stream)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return iter([table])
+
+        parts = self._parts(key)
+        if parts is not None:
+            with self._lock:
+                self.disk_hits += 1
+            return self._remember_batches(key, self._load(key, parts))
+
+        with self._lock:
+            self.misses += 1
+        return self._remember_batches(key, self._store(key, iter_event_batches(stream, **kwargs)))
+
+    def _remember_batches(self, key, batches):
+        """
+        Pass `batches` on and keep their table in memory if it is complete and small enough.
+        """
+        collected = []
+        size = 0
+        for batch in batches:
+            if collected is not None:
+                size += _table_size(batch)
+                if size <= self.max_entry_size:
+                    collected.append(batch)
+                else:
+                    collected = None
+            yield batch
+        if collected is not None:
+            self._remember(key, concat_event_tables(collected))
+
+    def _remember(self, key, table):
+        size = _table_size(table)
+        if size > self.max_entry_size:
+            return
+
+        with self._lock:
+            if key in self._tables:
+                self._size -= _table_size(self._tables.pop(key))
+            self._tables[key] = table
+            self._size += size
+            while self._size > self.max_size:
+                _, evicted = self._tables.popitem(last=False)
+                self._size -= _table_size(evicted)
+
+    def _path(self, key):
+        return self.cache_dir / key
+
+    def _parts(self, key):
+        """
+        The batch files of the stored entry of `key`, None if there is none.
+        """
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+            parts = sorted(path.glob('*.arrow'))
+        except OSError:
+            return None
+        return parts or None
+
+    def _load(self, key, parts):
+        for part in parts:
+            try:
+                table = pd.read_feather(part)
+            except Exception as e:
+                # E.g. evicted by another container, the batches yielded so far cannot be taken back
+                raise RuntimeError(f'Failed to read cached event log {self._path(key)}: {e}') from e
+            yield table
+
+    def _store(self, key, batches):
+        """
+        Pass `batches` on and write them through to the disk store, the entry
+        appears once the last batch has been written.
+        """
+        if self.cache_dir is None:
+            yield from batches
+            return
+
+        path = self._path(key)
+        tmp_path = None
+        try:
+            # Unique across the containers sharing the directory, whose pids may repeat
+            tmp_path = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=f'{key}.', suffix='.tmp'))
+            # mkdtemp creates the directory accessible by its owner only
+            tmp_path.chmod(0o755)
+        except OSError as e:
+            logging.warning(f'Failed to persist event log {path}: {e}')
+            tmp_path = None
+
+        complete = False
+        try:
+            for number, batch in enumerate(batches):
+                if tmp_path is not None:
+                    try:
+                        batch.to_feather(tmp_path / f'{number:06d}.arrow', compression='zstd')
+                    except Exception as e:
+                        logging.warning(f'Failed to persist event log {path}: {e}')
+                        shutil.rmtree(tmp_path, ignore_errors=True)
+                        tmp_path = None
+                yield batch
+            complete = True
+        finally:
+            if tmp_path is not None:
+                self._commit(tmp_path, path, complete)
+
+    def _commit(self, tmp_path, path, complete):
+        if complete:
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Stored by another worker in the meantime
+                pass
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if complete:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for p in self.cache_dir.iterdir():
+            if p.suffix == '.tmp':
+                continue
+            try:
+                if p.is_dir():
+                    size = sum(part.stat().st_size for part in p.glob('*.arrow'))
+                else:
+                    # Single-file entries of earlier versions are only evicted
+                    size = p.stat().st_size
+                entries.append((p.stat().st_mtime, size, p))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_disk_size:
+                break
+            total -= size
+            if p.is_dir():
+                shutil.rmtree(p, ignore_errors=True)
+            else:
+                p.unlink(missing_ok=True)
+
+
+log_cache = EventLogCache.from_env()
+os.register_at_fork(after_in_child=log_cache._after_fork)
@@ -0,0 +1,85 @@
+"""
+Fitting many samples (one per activity, or per resource and activity) in a
+process pool.
+
+The samples are copied once into a single shared-memory buffer; workers only
+receive the name of the buffer and the slice of their sample, so no sample
+is pickled. Results are merged in the order of the input, which makes the
+output independent of the number of workers and of scheduling.
+
+The default number of workers is read from MINER_FIT_WORKERS (default 1,
+i.e. fit sequentially in the request's process).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def default_workers():
+    return int(os.environ.get('MINER_FIT_WORKERS', 1))
+
+
+def workers_from_args(args):
+    """
+    Number of fitting workers from the `workers` query argument of a request.
+    Raises ValueError for invalid values.
+    """
+    if 'workers' not in args:
+        return None
+    try:
+        workers = int(args['workers'])
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise ValueError('Invalid workers. Expected a positive integer')
+    return workers
+
+
+def _fit_shared(fit_function, buffer_name, fit_options, bounds):
+    start, stop = bounds
+    buffer = shared_memory.SharedMemory(name=buffer_name)
+    values = np.ndarray((stop - start,), dtype=np.float64, buffer=buffer.buf, offset=start * 8)
+    try:
+        return fit_function(values, **fit_options)
+    finally:
+        # The view has to be gone before the mapping can be closed
+        del values
+        buffer.close()
+
+
+def fit_samples(fit_function, samples, workers=None, **fit_options):
+    """
+    Apply `fit_function(values, **fit_options)` to every sample of `samples`
+    ({KEY: 1-d array of floats}), using `workers` processes.
+
+    output: {KEY: fit_function result}, in the order of `samples`
+    """
+    workers = default_workers() if workers is None else workers
+    keys = list(samples.keys())
+    if workers <= 1 or len(keys) <= 1:
+        return {key: fit_function(np.asarray(samples[key], dtype=np.float64), **fit_options) for key in keys}
+
+    lengths = np.array([len(samples[key]) for key in keys], dtype=np.int64)
+    stops = np.cumsum(lengths)
+    starts = stops - lengths
+
+    buffer = shared_memory.SharedMemory(create=True, size=max(int(stops[-1]) * 8, 1))
+    try:
+        values = np.ndarray((int(stops[-1]),), dtype=np.float64, buffer=buffer.buf)
+        for key, start, stop in zip(keys, starts, stops):
+            values[start:stop] = samples[key]
+        del values
+
+        task = partial(_fit_shared, fit_function, buffer.name, fit_options)
+        bounds = [(int(start), int(stop)) for start, stop in zip(starts, stops)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(keys))) as executor:
+            results = list(executor.map(task, bounds, chunksize=max(1, len(keys) // (workers * 4))))
+    finally:
+        buffer.close()
+        buffer.unlink()
+
+    return dict(zip(keys, results))
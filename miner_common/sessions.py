@@ -0,0 +1,191 @@
+"""
+Named sessions for incremental mining of growing event logs.
+
+Instead of the whole history, clients upload only the events that were added
+since their last upload:
+
+    POST   /sessions/<name>/<endpoint>  add a delta, answer the updated result
+    GET    /sessions/<name>/<endpoint>  current result
+    DELETE /sessions/<name>             forget the session
+
+Every miner keeps the sufficient statistics of its result in a session state
+(sketches and moments of the samples, per resource and weekday min/max
+times, ...) that is updated from the delta, so an update costs time
+proportional to the delta and not to the history.
+
+States are pickled to MINER_SESSIONS_DIR (default: <tmp>/miner-sessions),
+one file per session and miner, and updated under an exclusive file lock,
+so all gunicorn workers see and update the same sessions.
+
+Per-case state (events still waiting to be paired, cases whose start has
+been counted) is kept for MINER_SESSION_HORIZON seconds (default 30 days, 0
+keeps every case) after the case was last seen, relative to the latest event
+of the session; a case that continues after that is taken for a new one.
+"""
+
+import fcntl
+import os
+import pickle
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import Blueprint, Response, jsonify, request
+
+SESSION_NAME_PATTERN = re.compile('[A-Za-z0-9_.-]{1,64}')
+
+
+DEFAULT_HORIZON = 30 * 24 * 60 * 60
+
+
+def session_horizon():
+    """
+    output: MINER_SESSION_HORIZON in ns, None if states keep every case
+    """
+    horizon = int(os.environ.get('MINER_SESSION_HORIZON', DEFAULT_HORIZON))
+    return horizon * 10**9 if horizon > 0 else None
+
+
+def validate_session_name(name):
+    if not SESSION_NAME_PATTERN.fullmatch(name) or name.startswith('.'):
+        raise ValueError('Invalid session name. Expected up to 64 letters, digits, "_", "-" or "."')
+
+
+class SessionStore:
+    def __init__(self, sessions_dir):
+        self.sessions_dir = Path(sessions_dir)
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get('MINER_SESSIONS_DIR', os.path.join(tempfile.gettempdir(), 'miner-sessions')))
+
+    def _path(self, name, kind):
+        validate_session_name(name)
+        return self.sessions_dir / name / f'{kind}.pickle'
+
+    @contextmanager
+    def update(self, name, kind, factory):
+        """
+        Lock the `kind` state of session `name` (created by `factory()` if there
+        is none yet) and yield it. The state is saved when the block finishes
+        without an exception.
+        """
+        path = self._path(name, kind)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self._load(path)
+            if state is None:
+                state = factory()
+            yield state
+
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+    def get(self, name, kind):
+        """
+        output: the `kind` state of session `name`, None if there is none
+        """
+        path = self._path(name, kind)
+        if not path.parent.exists():
+            return None
+        with open(path.with_suffix('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            return self._load(path)
+
+    def delete(self, name):
+        """
+        output: whether the session existed
+        """
+        session_dir = self._path(name, 'any').parent
+        if not session_dir.exists():
+            return False
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return True
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+
+session_store = SessionStore.from_env()
+
+
+@dataclass
+class SessionMiner:
+    """
+    Incremental counterpart of a mining endpoint: `state()` creates an empty
+    state, `update(state, stream, args)` adds the delta log in `stream` and
+    `result(state, args)` returns the response body. `validate(args)` raises
+    ValueError for invalid query arguments.
+    """
+    state: Callable
+    update: Callable
+    result: Callable
+    validate: Optional[Callable] = None
+    mimetype: str = 'application/json'
+
+
+def session_blueprint(miners, store=None):
+    """
+    Flask blueprint with the session routes for `miners` ({ENDPOINT: SessionMiner}).
+    """
+    store = session_store if store is None else store
+    blueprint = Blueprint('sessions', __name__)
+
+    def _lookup(name, endpoint):
+        miner = miners.get(endpoint)
+        if miner is None:
+            return None, (jsonify({'error': f'Unknown endpoint: {endpoint}, expected one of {list(miners)}'}), 404)
+        try:
+            validate_session_name(name)
+            if miner.validate is not None:
+                miner.validate(request.args)
+        except ValueError as e:
+            return None, (jsonify({'error': str(e)}), 400)
+        return miner, None
+
+    @blueprint.route('/sessions/<name>/<endpoint>', methods=['POST'])
+    def update_session(name, endpoint):
+        miner, error = _lookup(name, endpoint)
+        if error is not None:
+            return error
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': 'No file part'}), 400
+
+        with store.update(name, endpoint, miner.state) as state:
+            miner.update(state, request.files['file'].stream, request.args)
+        return Response(miner.result(state, request.args), mimetype=miner.mimetype)
+
+    @blueprint.route('/sessions/<name>/<endpoint>', methods=['GET'])
+    def read_session(name, endpoint):
+        miner, error = _lookup(name, endpoint)
+        if error is not None:
+            return error
+
+        state = store.get(name, endpoint)
+        if state is None:
+            return jsonify({'error': f'Session not found: {name}'}), 404
+        return Response(miner.result(state, request.args), mimetype=miner.mimetype)
+
+    @blueprint.route('/sessions/<name>', methods=['DELETE'])
+    def delete_session(name):
+        try:
+            deleted = store.delete(name)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not deleted:
+            return jsonify({'error': f'Session not found: {name}'}), 404
+        return jsonify({'session': name, 'deleted': True})
+
+    return blueprint
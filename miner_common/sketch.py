@@ -0,0 +1,184 @@
+"""
+Sampling and quantile sketches for samples too large to fit on as a whole.
+
+Reservoir keeps a uniform random sample of bounded size of everything it has
+been fed (Algorithm R). KLLSketch is a mergeable quantile sketch (Karnin,
+Lang and Liberty, 2016) whose memory grows with k * log(n) and whose
+normalized rank error is about `rank_error()`. Both are fed chunk by chunk,
+so they can be built in one streaming pass over the data. SampleStats
+bundles both with the moments of a sample that grows over time.
+"""
+
+import numpy as np
+
+SAMPLING_METHODS = ['reservoir', 'stratified']
+
+
+class Reservoir:
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.n = 0
+        self.values = np.empty(0)
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        free = max(0, self.capacity - len(self.values))
+        if free:
+            self.values = np.concatenate([self.values, values[:free]])
+            self.n += min(free, len(values))
+            values = values[free:]
+        if len(values) == 0:
+            return
+
+        # Item number t (0 based) replaces a random slot with probability capacity / (t + 1)
+        t = self.n + np.arange(len(values))
+        slots = (self.rng.random(len(values)) * (t + 1)).astype(np.int64)
+        accepted = slots < self.capacity
+        self.values[slots[accepted]] = values[accepted]
+        self.n += len(values)
+
+
+class KLLSketch:
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            # Half of the sorted items, every other one from a random offset, move up a level
+            items = np.sort(items)
+            kept = items[len(items) - len(items) % 2:]
+            promoted = items[self.rng.integers(2):len(items) - len(items) % 2:2]
+            self.levels[level] = kept
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        self.n += other.n
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def quantiles(self, q):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = np.asarray(q) * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, ranks, side='right'), len(items) - 1)]
+
+    def rank_error(self):
+        # Empirical single-sided bound of the Apache DataSketches KLL implementation (99% confidence)
+        if self.n <= self.k:
+            return 0.0
+        return 2.296 / self.k ** 0.9723
+
+
+class SampleStats:
+    def __init__(self, capacity=10_000, k=200, seed=None):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.reservoir = Reservoir(capacity, seed)
+        self.sketch = KLLSketch(k, seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+
+        # Chan et al.'s pairwise combination of the moments
+        n, mean, m2 = len(values), np.mean(values), np.sum((values - np.mean(values)) ** 2)
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.min = min(self.min, np.min(values))
+        self.max = max(self.max, np.max(values))
+
+        self.reservoir.update(values)
+        self.sketch.update(values)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+    @property
+    def sample(self):
+        return self.reservoir.values
+
+    def summary(self):
+        """
+        The statistics of `fitting.sample_summary` for everything fed so far:
+        exact moments and extremes, quartiles from the reservoir while it
+        holds every value and from the sketch afterwards.
+        """
+        if self.reservoir.n == len(self.reservoir.values):
+            q25, q75 = np.percentile(self.reservoir.values, [25, 75])
+        else:
+            q25, q75 = self.sketch.quantiles([0.25, 0.75])
+        return {
+            'n': self.n,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min,
+            'max': self.max,
+            'q25': q25,
+            'q75': q75,
+            'iqr': q75 - q25,
+        }
+
+
+def midpoint_quantiles(size):
+    return (np.arange(size) + 0.5) / size
+
+
+def stratified_sample(values, size, seed=None):
+    """
+    One random value from each of `size` equally sized strata of the sorted values.
+    """
+    sorted_values = np.sort(values)
+    bounds = np.linspace(0, len(sorted_values), size + 1)
+    rng = np.random.default_rng(seed)
+    picks = np.floor(bounds[:-1] + rng.random(size) * (bounds[1:] - bounds[:-1])).astype(np.int64)
+    return sorted_values[np.minimum(picks, len(sorted_values) - 1)]
+
+
+def reservoir_sample(values, size, seed=None, chunk_size=1_000_000):
+    reservoir = Reservoir(size, seed)
+    for start in range(0, len(values), chunk_size):
+        reservoir.update(values[start:start + chunk_size])
+    return reservoir.values
+
+
+def sketch_values(values, k=200, seed=None, chunk_size=1_000_000):
+    sketch = KLLSketch(k, seed)
+    for start in range(0, len(values), chunk_size):
+        sketch.update(values[start:start + chunk_size])
+    return sketch
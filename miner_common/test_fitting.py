@@ -0,0 +1,50 @@
+"""
+Regression tests for the fast distribution fits.
+
+Run from the repository root:
+    python -m pytest -q miner_common/test_fitting.py
+"""
+
+import numpy as np
+import pytest
+
+from miner_common.fitting import sample_summary, fit_distributions, score_distributions, best_fit_distribution
+from miner_common.sketch import SampleStats
+
+
+def best_fast_fit(values):
+    fitted = fit_distributions(values, sample_summary(values), fit_mode='fast')
+    scores = score_distributions(values, fitted)
+    return min(scores, key=scores.get), fitted
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('loc', [0, 1000])
+def test_fast_fit_recovers_lognormal(seed, loc):
+    values = loc + np.random.default_rng(seed).lognormal(np.log(600), 0.5, 2000)
+    best, fitted = best_fast_fit(values)
+    assert best == 'lognormal'
+    assert fitted['lognormal']['s'] == pytest.approx(0.5, rel=0.15)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_fast_fit_recovers_gamma(seed):
+    values = np.random.default_rng(seed).gamma(2.0, 300, 2000)
+    best, fitted = best_fast_fit(values)
+    assert best == 'gamma'
+    assert fitted['gamma']['a'] == pytest.approx(2.0, rel=0.15)
+
+
+def test_summary_of_sampled_values_is_exact():
+    values = np.random.default_rng(0).lognormal(np.log(600), 0.5, 50_000)
+    sample_stats = SampleStats(seed=0)
+    for chunk in np.array_split(values, 7):
+        sample_stats.update(chunk)
+
+    best, params, _, summary, sampling_info = best_fit_distribution(
+        sample_stats.sample, sketch=sample_stats.sketch, summary=sample_stats.summary())
+    assert sampling_info['sample_size'] < len(values)
+    assert summary['mean'] == pytest.approx(np.mean(values))
+    assert summary['std'] == pytest.approx(np.std(values))
+    assert (summary['min'], summary['max']) == (np.min(values), np.max(values))
+    assert best == 'lognormal' and params['loc'] < summary['min']
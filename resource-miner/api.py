@@ -1,9 +1,11 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from pydantic import BaseModel
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from resource_calendars import structured_resource_calendar
-from role_resource import get_activity_resources
+from resource_calendars import structured_resource_calendar, ResourceCalendarState
+from role_resource import get_activity_resources, ActivityResourcesState
+from miner_common.jobs import Task, job_blueprint
+from miner_common.log_cache import log_cache
+from miner_common.sessions import SessionMiner, session_blueprint
 import json
 
 app = Flask(__name__)
@@ -14,16 +16,35 @@ CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 class LogFile(BaseModel):
     path: str
 
+def mine_resource_calendars(stream, args=None):
+    return json.dumps(structured_resource_calendar(log_cache.read_event_table(stream)))
+
+def mine_role_resources(stream, args=None):
+    return json.dumps(get_activity_resources(log_cache.read_event_table(stream)))
+
+app.register_blueprint(job_blueprint({
+    'resource-calendars': Task(mine_resource_calendars),
+    'role-resources': Task(mine_role_resources),
+}))
+
+def update_session_state(state, stream, args):
+    state.update(log_cache.read_event_table(stream))
+
+def session_result(state, args):
+    return json.dumps(state.result())
+
+app.register_blueprint(session_blueprint({
+    'resource-calendars': SessionMiner(ResourceCalendarState, update_session_state, session_result),
+    'role-resources': SessionMiner(ActivityResourcesState, update_session_state, session_result),
+}))
+
 @app.route("/resource-calendars/", methods=["POST"])
 def resource_calendars():
     try:
         file = request.files['file']
-        filepath = "log.xes"
-        file.save(filepath)
-        log = xes_importer.apply(filepath)
-        calendars = structured_resource_calendar(log)
+        calendars = mine_resource_calendars(file.stream)
         return app.response_class(
-            response=json.dumps(calendars),
+            response=calendars,
             mimetype='application/json'
         )
     except Exception as e:
@@ -36,12 +57,9 @@ def resource_calendars():
 def role_resources():
     try:
         file = request.files['file']
-        filepath = "log.xes"
-        file.save(filepath)
-        log = xes_importer.apply(filepath)
-        resources = get_activity_resources(log)
+        resources = mine_role_resources(file.stream)
         return app.response_class(
-            response=json.dumps(resources),
+            response=resources,
             mimetype='application/json'
         )
     except Exception as e:
@@ -50,5 +68,9 @@ def role_resources():
             mimetype='application/json'
         ), 500
 
+@app.route('/log-cache', methods=['GET'])
+def log_cache_stats():
+    return jsonify(log_cache.stats())
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=8001)
@@ -0,0 +1,44 @@
+"""
+Benchmark of `structured_resource_calendar` against the former implementation
+that ran a separate pandas pipeline per resource.
+
+Run from the resource-miner directory (with the repository root on the path):
+    PYTHONPATH=.. python benchmark_calendars.py
+"""
+
+import pandas as pd
+
+from miner_common.benchmark import synthetic_table, timed
+from miner_common.event_log import event_times, RESOURCE
+from resource_calendars import structured_resource_calendar
+
+
+def per_resource_calendar(table):
+    timestamps = event_times(table)
+    calendar = []
+    for resource, times in timestamps.groupby(table[RESOURCE], sort=False, observed=True):
+        times = times.reset_index(drop=True)
+        times_df = pd.DataFrame({'timestamp': times, 'day_of_week': times.dt.day_name(), 'date': times.dt.date})
+        workdays = times.dt.day_name().unique().tolist()
+        min_max_times_per_day = times_df.groupby(['day_of_week', 'date'])['timestamp'].agg(['min', 'max'])
+        min_max_times = min_max_times_per_day.groupby(level=0).agg({'min': 'min', 'max': 'max'})
+        min_max_times_dict = min_max_times.apply(
+            lambda row: {'min': row['min'].time().isoformat(), 'max': row['max'].time().isoformat()}, axis=1).to_dict()
+        calendar.append({'name': resource, 'workdays': workdays, 'weekly_times': min_max_times_dict})
+    return calendar
+
+
+if __name__ == '__main__':
+    print(f"{'events':>10} {'resources':>10} {'vectorized (s)':>15} {'per resource (s)':>17}")
+    for n_events, n_resources in [(100_000, 10), (100_000, 1_000), (100_000, 5_000), (1_000_000, 1_000), (2_000_000, 1_000)]:
+        table = synthetic_table(n_events // 10, events_per_case=10, n_resources=n_resources)
+        result, vectorized_time = timed(structured_resource_calendar, table)
+        if n_events * n_resources <= 10**9:
+            expected, reference_time = timed(per_resource_calendar, table)
+            # The event counts and utilisation are not part of the former output
+            result = [{key: value for key, value in calendar.items() if key not in ['events', 'utilisation']} for calendar in result]
+            assert result == expected, 'calendars differ'
+            reference = f'{reference_time:17.3f}'
+        else:
+            reference = f"{'-':>17}"
+        print(f'{n_events:>10} {n_resources:>10} {vectorized_time:15.3f} {reference}')
@@ -1,58 +1,78 @@
-import pm4py
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from collections import defaultdict
-import pandas as pd
 import json
+from resource_index import resource_index, NS_PER_DAY
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _time_isoformat(ns):
+    # Same as datetime.time.isoformat() for the time of day of a timestamp in ns
+    us = ns % NS_PER_DAY // 1000
+    seconds, us = divmod(int(us), 10**6)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if us:
+        return f'{hours:02d}:{minutes:02d}:{seconds:02d}.{us:06d}'
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+
+
+def weekly_min_max_times(log):
+    """
+    output: {(RESOURCE, DAY_OF_WEEK): [MIN, MAX]} with timestamps in ns, in order of the first event
+    """
+    return resource_index(log).weekly_min_max_times()
+
+
+def format_resource_calendar(min_max_times, utilisation):
+    """
+    `utilisation` is {RESOURCE: [EVENTS, SHARE]} as returned by `ResourceIndex.resource_utilisation`.
+    """
+    structured_resource_calendar = dict()
+    for (resource, day_of_week), (min_time, max_time) in min_max_times.items():
+        calendar = structured_resource_calendar.setdefault(resource, {'name': resource, 'workdays': [], 'weekly_times': dict()})
+        calendar['workdays'].append(WEEKDAYS[day_of_week])
+        calendar['weekly_times'][WEEKDAYS[day_of_week]] = {
+            'min': _time_isoformat(min_time),
+            'max': _time_isoformat(max_time),
+        }
+
+    for resource, calendar in structured_resource_calendar.items():
+        calendar['weekly_times'] = dict(sorted(calendar['weekly_times'].items()))
+        calendar['events'], calendar['utilisation'] = utilisation[resource]
+    return list(structured_resource_calendar.values())
+
 
 def structured_resource_calendar(log):
-    resource_calendar = defaultdict(list)
-
-    # Step 1: Extract timestamps for each resource
-    for case in log:
-        for event in case:
-            resource = event['org:resource']
-            timestamp = event['time:timestamp']
-            resource_calendar[resource].append(timestamp)
-
-    structured_resource_calendar = []
-
-    for resource, timestamps in resource_calendar.items():
-        # Convert timestamps to pandas datetime, ensuring they are timezone naive
-        times = pd.Series(pd.to_datetime(timestamps)).dt.tz_localize(None)
-        
-        # Step 2: Classify times by day of the week and date
-        times_df = pd.DataFrame({
-            'timestamp': times,
-            'day_of_week': times.dt.day_name(),
-            'date': times.dt.date
-        })
-        
-        # Get the unique workdays
-        workdays = times.dt.day_name().unique().tolist()
-        
-        # Step 3: Find min and max times for each day of the week ensuring they are from the same date
-        min_max_times_per_day = times_df.groupby(['day_of_week', 'date'])['timestamp'].agg(['min', 'max'])
-        
-        # Aggregate min and max times by day of the week
-        min_max_times = min_max_times_per_day.groupby(level=0).agg({'min': 'min', 'max': 'max'})
-
-        # Ensure min and max times are correctly formatted
-        min_max_times_dict = min_max_times.apply(
-            lambda row: {
-                'min': row['min'].time().isoformat() if pd.notna(row['min']) else None,
-                'max': row['max'].time().isoformat() if pd.notna(row['max']) else None
-            }, axis=1).to_dict()
-
-        structured_resource_calendar.append({
-            'name': resource,
-            'workdays': workdays,
-            'weekly_times': min_max_times_dict,
-        })
-
-    return structured_resource_calendar
+    index = resource_index(log)
+    return format_resource_calendar(index.weekly_min_max_times(), index.resource_utilisation())
+
+
+class ResourceCalendarState:
+    """
+    Sufficient statistics of the resource calendars of a growing log (see
+    `miner_common.sessions`): the min/max times per resource and weekday and
+    the events per resource.
+    """
+
+    def __init__(self):
+        self.min_max_times = dict()
+        self.resource_events = dict()
+
+    def update(self, log):
+        index = resource_index(log)
+        for resource, (events, _) in index.resource_utilisation().items():
+            self.resource_events[resource] = self.resource_events.get(resource, 0) + events
+        for key, (min_time, max_time) in index.weekly_min_max_times().items():
+            times = self.min_max_times.setdefault(key, [min_time, max_time])
+            times[0] = min(times[0], min_time)
+            times[1] = max(times[1], max_time)
+
+    def result(self):
+        total = sum(self.resource_events.values())
+        utilisation = {resource: [events, events / total] for resource, events in self.resource_events.items()}
+        return format_resource_calendar(self.min_max_times, utilisation)
 
 # Example usage:
-# log = xes_importer.apply('path_to_log.xes')
+# log = read_event_table('path_to_log.xes')
 # print(json.dumps(structured_resource_calendar(log), indent=4))
 
 
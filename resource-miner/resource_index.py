@@ -0,0 +1,114 @@
+"""
+Activity x resource incidence index of an event table.
+
+A single pass over the categorical codes of the events collects what the
+resource endpoints need: a sparse activity x resource matrix of event counts
+(rows and columns are the activity and resource categories of the table), the
+order in which the pairs first appear, and the earliest and latest event of
+every resource per weekday for the calendars. The index of a table is kept for
+as long as the table is alive, so `/role-resources` and `/resource-calendars`
+on the same (cached) upload build it once.
+"""
+
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from miner_common.event_log import as_event_table, ACTIVITY, RESOURCE, TIMESTAMP
+
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+
+class ResourceIndex:
+    def __init__(self, table):
+        activities = table[ACTIVITY].cat.codes.to_numpy()
+        resources = table[RESOURCE].cat.codes.to_numpy()
+        timestamps = table[TIMESTAMP].to_numpy()
+        self.activities = table[ACTIVITY].cat.categories
+        self.resources = table[RESOURCE].cat.categories
+        n_resources = len(self.resources)
+
+        has_resource = resources >= 0
+        resources, timestamps, activities = resources[has_resource], timestamps[has_resource], activities[has_resource]
+
+        # Pairs and their counts, in order of first appearance
+        has_activity = activities >= 0
+        pair_keys = activities[has_activity].astype(np.int64) * n_resources + resources[has_activity]
+        self.counts = sparse.coo_matrix(
+            (np.ones(len(pair_keys), dtype=np.int64), (activities[has_activity], resources[has_activity])),
+            shape=(len(self.activities), n_resources),
+        ).tocsr()
+        pairs = pd.unique(pair_keys)
+        self.pair_activities, self.pair_resources = np.divmod(pairs, max(n_resources, 1))
+
+        # Earliest and latest event per resource and weekday (1970-01-01 was a Thursday)
+        day_keys = resources.astype(np.int64) * 7 + (timestamps // NS_PER_DAY + 3) % 7
+        min_times = np.full(n_resources * 7, np.iinfo(np.int64).max, dtype=np.int64)
+        max_times = np.full(n_resources * 7, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(min_times, day_keys, timestamps)
+        np.maximum.at(max_times, day_keys, timestamps)
+        days = pd.unique(day_keys)
+        self.day_resources, self.day_weekdays = np.divmod(days, 7)
+        self.day_min_times, self.day_max_times = min_times[days], max_times[days]
+
+        self.resource_events = np.bincount(resources, minlength=n_resources)
+        self.events = len(resources)
+
+    def pair_counts(self):
+        """
+        output: event counts of the pairs, in order of first appearance
+        """
+        return np.asarray(self.counts[self.pair_activities, self.pair_resources]).ravel()
+
+    def activity_resources(self):
+        """
+        output: {ACTIVITY: {RESOURCE: EVENTS}} in order of first appearance
+        """
+        activity_resources = dict()
+        for activity, resource, count in zip(self.pair_activities, self.pair_resources, self.pair_counts()):
+            activity_resources.setdefault(self.activities[activity], dict())[self.resources[resource]] = int(count)
+        return activity_resources
+
+    def weekly_min_max_times(self):
+        """
+        output: {(RESOURCE, DAY_OF_WEEK): [MIN, MAX]} with timestamps in ns, in order of the first event
+        """
+        return {
+            (self.resources[resource], int(day_of_week)): [int(min_time), int(max_time)]
+            for resource, day_of_week, min_time, max_time
+            in zip(self.day_resources, self.day_weekdays, self.day_min_times, self.day_max_times)
+        }
+
+    def resource_utilisation(self):
+        """
+        output: {RESOURCE: [EVENTS, SHARE OF THE EVENTS WITH A RESOURCE]} for the resources with events
+        """
+        return {
+            self.resources[resource]: [int(events), float(events / self.events)]
+            for resource, events in enumerate(self.resource_events) if events
+        }
+
+
+_indexes = dict()
+_lock = threading.Lock()
+
+
+def resource_index(log):
+    """
+    The `ResourceIndex` of `log`, built once per event table.
+    """
+    table = as_event_table(log)
+    key = id(table)
+    with _lock:
+        entry = _indexes.get(key)
+    if entry is not None and entry[0]() is table:
+        return entry[1]
+
+    index = ResourceIndex(table)
+    with _lock:
+        _indexes[key] = (weakref.ref(table), index)
+    weakref.finalize(table, _indexes.pop, key, None)
+    return index
@@ -1,22 +1,42 @@
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from collections import defaultdict
-import pandas as pd
+from resource_index import resource_index
 
-def get_activity_resources(log):
-    activity_resources = defaultdict(set)
+def activity_resource_sets(log):
+    """
+    output: {ACTIVITY: {RESOURCE: EVENTS}} in order of first appearance
+    """
+    return resource_index(log).activity_resources()
 
-    for case_index, case in enumerate(log):
-        for event in case:
-            activity = event['concept:name']
-            resource = event['org:resource']
-            activity_resources[activity].add(resource)
 
+def format_activity_resources(activity_resources):
     activity_resource_list = []
     for activity, resources in activity_resources.items():
         activity_resource_list.append({
             'Activity': activity,
-            'Resources': ', '.join(resources)
+            'Resources': ', '.join(resources),
+            'Events': dict(resources),
         })
 
-    df = pd.DataFrame(activity_resource_list)
-    return df.to_dict(orient='records')
+    return activity_resource_list
+
+
+def get_activity_resources(log):
+    return format_activity_resources(activity_resource_sets(log))
+
+
+class ActivityResourcesState:
+    """
+    Sufficient statistics of the activity resources of a growing log (see
+    `miner_common.sessions`): the events per activity and resource.
+    """
+
+    def __init__(self):
+        self.activity_resources = dict()
+
+    def update(self, log):
+        for activity, resources in activity_resource_sets(log).items():
+            known = self.activity_resources.setdefault(activity, dict())
+            for resource, events in resources.items():
+                known[resource] = known.get(resource, 0) + events
+
+    def result(self):
+        return format_activity_resources(self.activity_resources)
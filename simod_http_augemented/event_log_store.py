@@ -0,0 +1,55 @@
+"""
+Columnar copy of the event log of a request.
+
+The uploaded log is parsed once by the discovery process and stored next to
+the upload as `event_log.parquet`: zstd compressed, with typed timestamp
+columns and the repetitive string columns (case ids, activities, resources)
+dictionary encoded, so they come back as pandas categoricals. It is served
+by the download endpoint, which also converts it back to CSV for logs that
+were uploaded as XML.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EVENT_LOG_FILE = 'event_log.parquet'
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+# String columns with at most this share of distinct values are stored as categories
+CATEGORY_MAX_SHARE = 0.5
+CSV_BATCH_SIZE = 64 * 1024
+
+
+def write_columnar(event_log: pd.DataFrame, path: Path):
+    event_log = event_log.copy(deep=False)
+    for column in event_log.columns:
+        values = event_log[column]
+        if values.dtype == object:
+            # Arrow needs one type per column, e.g. ids parsed as numbers in some rows and as strings in others
+            values = values.where(values.isna(), values.astype(str))
+            event_log[column] = values
+        is_string = values.dtype == object or pd.api.types.is_string_dtype(values.dtype)
+        if is_string and not isinstance(values.dtype, pd.CategoricalDtype) \
+                and values.nunique() <= CATEGORY_MAX_SHARE * len(values):
+            event_log[column] = values.astype('category')
+
+    tmp_path = Path(path).with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        pq.write_table(pa.Table.from_pandas(event_log, preserve_index=False), tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def csv_chunks(path: Path):
+    """
+    The log as CSV, one chunk of encoded rows per record batch.
+    """
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    header = True
+    for batch in parquet_file.iter_batches(batch_size=CSV_BATCH_SIZE):
+        yield batch.to_pandas().to_csv(index=False, header=header).encode()
+        header = False
@@ -2,16 +2,22 @@
 # orginally created by Ihar Suvorau
 # It adds cors clearance to make the api usable with other tools
 
+import json
 import logging
 import os
+import re
 import shutil
+import zlib
+from email.utils import formatdate
 from pathlib import Path
 from typing import Union, Optional
 
+import anyio
 import pandas as pd
 import uvicorn
-from fastapi import FastAPI, BackgroundTasks, Request, Response, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Response, Form, HTTPException
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi_utils.tasks import repeat_every
 ### <Added import> 
 from fastapi.middleware.cors import CORSMiddleware
@@ -25,6 +31,10 @@ from simod_http.app import Response as AppResponse, RequestStatus, Request as Ap
     NotSupported
 from simod_http.archiver import make_url_for
 from simod_http.executor import Executor
+from simod_http.event_log_store import EVENT_LOG_FILE, PARQUET_MEDIA_TYPE, write_columnar, csv_chunks
+from simod_http.notifications import CallbackDispatcher
+from simod_http.request_index import RequestIndex
+from simod_http.scheduler import DiscoveryScheduler, QUEUE_FILE
 
 debug = os.environ.get('SIMOD_HTTP_DEBUG', 'false').lower() == 'true'
 
@@ -37,6 +47,54 @@ settings.simod_http_storage_path = Path(settings.simod_http_storage_path)
 
 app = FastAPI()
 
+# Downloads are streamed in chunks of this size, text files are gzip encoded for clients accepting it
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_GZIP_MEDIA_TYPES = ['text/csv', 'application/xml', 'application/json', 'text/plain']
+_RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+
+# Uploads are written to the request directory in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Maximum size of a request body in bytes, 0 disables the limit
+max_upload_size = int(os.environ.get('SIMOD_HTTP_MAX_UPLOAD_SIZE', 1024 ** 3))
+
+
+class UploadSizeLimit:
+    """
+    Refuses request bodies larger than `max_size` bytes with 413: right away if the Content-Length header
+    announces a larger body, otherwise as soon as more bytes than allowed have been received.
+    """
+
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ['POST', 'PUT'] or self.max_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        message = f'The upload exceeds the maximum size of {self.max_size} bytes'
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_size:
+            await JSONResponse(status_code=413, content={'detail': message})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            event = await receive()
+            if event['type'] == 'http.request':
+                received += len(event.get('body', b''))
+                if received > self.max_size:
+                    raise HTTPException(status_code=413, detail=message)
+            return event
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimit, max_size=max_upload_size)
+
 ### <Added Cors> 
 origins = ["*"]
 
@@ -54,10 +112,64 @@ app.add_middleware(
 
 def run_simod_discovery(request: Request, settings: Settings):
     """
-    Run Simod with the user's configuration.
+    Read the uploaded event log and run Simod with the user's configuration. The parsed log is stored as a
+    columnar file for the downloads of the request, if possible.
     """
-    executor = Executor(app_settings=settings, request=request)
-    executor.run()
+    configuration = request.configuration
+    try:
+        event_log, event_log_csv_path = read_event_log(configuration.common.log_path, configuration.common.log_ids)
+    except Exception as e:
+        logging.error(f'Failed to read the event log of request {request.id}: {str(e)}')
+        request.status = RequestStatus.FAILURE
+        request.timestamp = pd.Timestamp.now()
+        request.save()
+        request_index.record(request)
+        notify(request)
+        return
+
+    # Only the downloads read the columnar copy, the discovery goes on without it
+    try:
+        write_columnar(event_log, request.output_dir / EVENT_LOG_FILE)
+    except Exception as e:
+        logging.warning(f'Failed to store the columnar event log of request {request.id}: {str(e)}')
+
+    request.event_log = event_log
+    request.event_log_csv_path = event_log_csv_path
+    request.save()
+
+    # The callback is delivered by the dispatcher of the service, not by the executor
+    notification_settings = request.notification_settings
+    request.notification_settings = None
+    try:
+        executor = Executor(app_settings=settings, request=request)
+        executor.run()
+    finally:
+        request.notification_settings = notification_settings
+        request.save()
+        request_index.record(request)
+    notify(request)
+
+
+def notify(request: AppRequest):
+    """
+    Queue the HTTP callback of a finished request, if it asked for one.
+    """
+    notification_settings = request.notification_settings
+    if notification_settings is None or notification_settings.method != NotificationMethod.HTTP:
+        return
+
+    response = AppResponse(
+        request_id=request.id,
+        request_status=request.status,
+        archive_url=make_url_for(request.id, Path(f'{request.id}.tar.gz'),
+                                 settings) if request.status == RequestStatus.SUCCESS else None,
+    )
+    callback_dispatcher.enqueue(notification_settings.callback_url, json.loads(response.json()))
+
+
+request_index = RequestIndex.from_settings(settings)
+callback_dispatcher = CallbackDispatcher.from_env(settings)
+scheduler = DiscoveryScheduler.from_env(settings, run_simod_discovery, request_index, notify)
 
 
 # Hooks
@@ -82,30 +194,49 @@ async def application_startup():
 
     logging.debug(f'Application settings: {settings}')
 
+    await run_in_threadpool(_rebuild_request_index)
+    scheduler.recover()
+    await callback_dispatcher.start()
+
+
+def _rebuild_request_index():
+    requests_dir = Path(settings.simod_http_storage_path) / 'requests'
+
+    if requests_dir.exists():
+        for request_dir in requests_dir.iterdir():
+            if request_dir.is_dir():
+                _remove_empty_or_orphaned_request_dir(request_dir)
+
+    request_index.rebuild(requests_dir, settings)
+
 
 @app.on_event('shutdown')
 async def application_shutdown():
-    requests_dir = Path(settings.simod_http_storage_path) / 'requests'
+    scheduler.shutdown()
+    await callback_dispatcher.stop()
+    await run_in_threadpool(_fail_unfinished_requests)
 
-    if not requests_dir.exists():
-        return
 
-    for request_dir in requests_dir.iterdir():
-        logging.info(f'Checking request directory before shutting down: {request_dir}')
+def _fail_unfinished_requests():
+    requests_dir = Path(settings.simod_http_storage_path) / 'requests'
 
-        await _remove_empty_or_orphaned_request_dir(request_dir)
+    for request_id in request_index.unfinished():
+        # Queued requests are resumed on the next start
+        if (requests_dir / request_id / QUEUE_FILE).exists():
+            continue
 
         try:
-            request = AppRequest.load(request_dir.name, settings)
+            request = AppRequest.load(request_id, settings)
         except Exception as e:
-            logging.error(f'Failed to load request: {request_dir.name}, {str(e)}')
+            logging.error(f'Failed to load request: {request_id}, {str(e)}')
             continue
 
-        # At the end, there are only 'failed' or 'succeeded' requests
+        # At the end, there are only 'failed', 'succeeded' or queued requests
         if request.status not in [RequestStatus.SUCCESS, RequestStatus.FAILURE]:
             request.status = RequestStatus.FAILURE
             request.timestamp = pd.Timestamp.now()
             request.save()
+        request_index.record(request)
 
 
 @app.on_event('startup')
@@ -113,37 +244,14 @@ async def application_shutdown():
 async def clean_up():
     requests_dir = Path(settings.simod_http_storage_path) / 'requests'
 
-    if not requests_dir.exists():
-        return
-
-    current_timestamp = pd.Timestamp.now()
-    expire_after_delta = pd.Timedelta(seconds=settings.simod_http_request_expiration_timedelta)
-
-    for request_dir in requests_dir.iterdir():
-        if request_dir.is_dir():
-            logging.info(f'Checking request directory for expired data: {request_dir}')
+    # Removes expired requests and requests without timestamp that are neither running nor queued
+    for request_id in await run_in_threadpool(request_index.expired, pd.Timestamp.now()):
+        logging.info(f'Removing request folder for {request_id}, expired or no timestamp and not running or queued')
+        await run_in_threadpool(shutil.rmtree, requests_dir / request_id, ignore_errors=True)
+        request_index.remove(request_id)
 
-            await _remove_empty_or_orphaned_request_dir(request_dir)
 
-            try:
-                request = AppRequest.load(request_dir.name, settings)
-            except Exception as e:
-                logging.error(f'Failed to load request: {request_dir.name}, {str(e)}')
-                continue
-
-            # Removes expired requests
-            expired_at = request.timestamp + expire_after_delta
-            if expired_at <= current_timestamp:
-                logging.info(f'Removing request folder for {request_dir.name}, expired at {expired_at}')
-                shutil.rmtree(request_dir, ignore_errors=True)
-
-            # Removes requests without timestamp that are not running
-            if request.timestamp is None and request.status != RequestStatus.RUNNING:
-                logging.info(f'Removing request folder for {request_dir.name}, no timestamp and not running')
-                shutil.rmtree(request_dir, ignore_errors=True)
-
-
-async def _remove_empty_or_orphaned_request_dir(request_dir):
+def _remove_empty_or_orphaned_request_dir(request_dir):
     # Removes empty directories
     if len(list(request_dir.iterdir())) == 0:
         logging.info(f'Removing empty directory: {request_dir}')
@@ -164,55 +272,112 @@ async def request_exception_handler(_, exc: BaseRequestException) -> JSONRespons
 # Routes
 
 @app.get('/discoveries/{request_id}/{file_name}')
-async def read_discovery_file(request_id: str, file_name: str):
+async def read_discovery_file(request_id: str, file_name: str, http_request: Request):
     """
-    Get a file from a discovery request.
+    Get a file from a discovery request. The file is streamed from disk in chunks and supports
+    conditional (If-None-Match) and partial (Range) requests. Text files are gzip encoded on the fly
+    for clients that accept it.
     """
-    request = AppRequest.load(request_id, settings)
+    request = await run_in_threadpool(AppRequest.load, request_id, settings)
 
     if not request.output_dir.exists():
         raise NotFound(request_id=request_id, request_status=request.status, message='Request not found on the server')
 
     file_path = request.output_dir / file_name
-    if not file_path.exists():
+    columnar_path = request.output_dir / EVENT_LOG_FILE
+    if not file_path.is_file() and file_name == 'event_log.csv' and columnar_path.is_file():
+        # Logs uploaded as XML are converted from the columnar copy
+        return StreamingResponse(
+            iterate_in_threadpool(csv_chunks(columnar_path)),
+            media_type='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{file_name}"'},
+        )
+    if not file_path.is_file():
         raise NotFound(request_id=request_id, request_status=request.status, message=f'File not found: {file_name}')
 
     media_type = await _infer_media_type_from_extension(file_name)
-
-    return Response(
-        content=file_path.read_bytes(),
-        media_type=media_type,
-        headers={
-            'Content-Disposition': f'attachment; filename="{file_name}"',
-        }
+    stat = await run_in_threadpool(file_path.stat)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{file_name}"',
+        'Accept-Ranges': 'bytes',
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+    }
+    range_header = http_request.headers.get('range')
+    if range_header is not None and http_request.headers.get('if-range', etag) != etag:
+        # The client's copy is outdated, it gets the whole file
+        range_header = None
+    use_gzip = (
+            range_header is None
+            and media_type in DOWNLOAD_GZIP_MEDIA_TYPES
+            and 'gzip' in http_request.headers.get('accept-encoding', '')
     )
+    if media_type in DOWNLOAD_GZIP_MEDIA_TYPES:
+        headers['Vary'] = 'Accept-Encoding'
+    # The gzip encoded representation is a different entity, it needs an ETag of its own
+    headers['ETag'] = f'{etag[:-1]}-gzip"' if use_gzip else etag
+
+    if_none_match = http_request.headers.get('if-none-match')
+    if if_none_match is not None and (if_none_match.strip() == '*' or headers['ETag'] in _etags(if_none_match)):
+        return Response(status_code=304, headers=headers)
+
+    if range_header is not None:
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{stat.st_size}'})
+        if byte_range != (0, stat.st_size - 1):
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            headers['Content-Length'] = str(end - start + 1)
+            return StreamingResponse(
+                _file_chunks(file_path, start, end - start + 1),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return StreamingResponse(_gzip_chunks(_file_chunks(file_path)), media_type=media_type, headers=headers)
+
+    return FileResponse(file_path, media_type=media_type, headers=headers, stat_result=stat)
 
 
 @app.get('/discoveries/{request_id}')
-async def read_discovery(request_id: str) -> AppResponse:
+async def read_discovery(request_id: str) -> JSONResponse:
     """
-    Get the status of the request.
+    Get the status of the request and, while it waits for a worker, its position in the queue.
     """
-    request = AppRequest.load(request_id, settings)
-
-    return AppResponse(
+    status = request_index.status(request_id)
+    if status is None:
+        # Not indexed yet, e.g. stored by another instance
+        request = await run_in_threadpool(AppRequest.load, request_id, settings)
+        request_index.record(request)
+        status = request.status
+
+    response = AppResponse(
         request_id=request_id,
-        request_status=request.status,
-        archive_url=make_url_for(request.id, Path(f'{request.id}.tar.gz'),
-                                 settings) if request.status == RequestStatus.SUCCESS else None,
+        request_status=status,
+        archive_url=make_url_for(request_id, Path(f'{request_id}.tar.gz'),
+                                 settings) if status == RequestStatus.SUCCESS else None,
     )
+    content = response.dict()
+    content['queue_position'] = scheduler.queue_position(request_id)
+    return JSONResponse(content=content)
 
 
 @app.post('/discoveries')
 async def create_discovery(
-        background_tasks: BackgroundTasks,
         configuration=Form(),
         event_log=Form(),
         callback_url: Optional[str] = None,
         email: Optional[str] = None,
+        priority: int = 0,
 ) -> JSONResponse:
     """
-    Create a new business process model discovery and optimization request.
+    Create a new business process model discovery and optimization request. Requests of higher `priority`
+    leave the queue first.
     """
     global settings
 
@@ -221,6 +386,7 @@ async def create_discovery(
     if email is not None:
         request.status = RequestStatus.FAILURE
         request.save()
+        request_index.record(request)
 
         raise NotSupported(
             request_id=request.id,
@@ -230,12 +396,14 @@ async def create_discovery(
 
     # Configuration
 
-    configuration = Configuration.from_stream(configuration.file)
+    configuration = await run_in_threadpool(Configuration.from_stream, configuration.file)
 
     # Event log
 
     event_log_file_extension = _infer_event_log_file_extension_from_header(event_log.content_type)
     if event_log_file_extension is None:
+        # Indexed so that the clean up removes the unusable request
+        request_index.record(request)
         raise UnsupportedMediaType(
             request_id=request.id,
             request_status=request.status,
@@ -244,24 +412,22 @@ async def create_discovery(
         )
 
     event_log_path = request.output_dir / f'event_log{event_log_file_extension}'
-    event_log_path.write_bytes(event_log.file.read())
+    await _write_upload(event_log, event_log_path)
 
     configuration.common.log_path = event_log_path.absolute()
     configuration.common.test_log_path = None
 
-    event_log, event_log_csv_path = read_event_log(configuration.common.log_path, configuration.common.log_ids)
-
+    # The log is parsed by the discovery process, the response must not wait for it
     request.configuration = configuration
-    request.event_log = event_log
-    request.event_log_csv_path = event_log_csv_path
     request.status = RequestStatus.ACCEPTED
-    request.save()
+    await run_in_threadpool(request.save)
+    request_index.record(request)
 
     # Response
 
     response = AppResponse(request_id=request.id, request_status=request.status)
 
-    background_tasks.add_task(run_simod_discovery, request, settings)
+    await run_in_threadpool(scheduler.submit, request, priority)
 
     return response.json_response(status_code=202)
 
@@ -302,6 +468,61 @@ async def _empty_request_from_params(
     return request
 
 
+async def _write_upload(upload, path: Path):
+    async with await anyio.open_file(path, 'wb') as file:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            await file.write(chunk)
+
+
+def _etags(header: str) -> list:
+    return [etag.strip().removeprefix('W/') for etag in header.split(',')]
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """
+    Parses a single byte range (`bytes=start-end`, `bytes=start-` or `bytes=-suffix`) into the first and last
+    byte positions. Multiple ranges are not supported and answered with the whole file.
+    """
+    if ',' in header:
+        return 0, size - 1
+
+    match = _RANGE_PATTERN.fullmatch(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '' or int(end) == 0:
+            return None
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = size - 1 if end == '' else min(int(end), size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+async def _file_chunks(path: Path, start: int = 0, length: Optional[int] = None):
+    async with await anyio.open_file(path, 'rb') as file:
+        await file.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = await file.read(DOWNLOAD_CHUNK_SIZE if remaining is None else min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+async def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = await run_in_threadpool(compressor.compress, chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 def _infer_event_log_file_extension_from_header(
         content_type: str,
 ) -> Union[str, None]:
@@ -328,6 +549,8 @@ async def _infer_media_type_from_extension(file_name) -> str:
         media_type = 'image/png'
     elif file_name.endswith('.jpg') or file_name.endswith('.jpeg'):
         media_type = 'image/jpeg'
+    elif file_name.endswith('.parquet'):
+        media_type = PARQUET_MEDIA_TYPE
     elif file_name.endswith('.pdf'):
         media_type = 'application/pdf'
     elif file_name.endswith('.txt'):
@@ -0,0 +1,183 @@
+"""
+Delivery of the HTTP callbacks of finished discoveries.
+
+Notifications are written to an outbox in the storage (`outbox/<id>.json`)
+by whichever process finishes the request, and delivered by a single
+dispatcher in the event loop of the service: one pooled `httpx.AsyncClient`
+for all callbacks, at most SIMOD_HTTP_CALLBACK_CONCURRENCY deliveries at a
+time, and failed deliveries retried with exponential backoff. Notifications
+stay in the outbox until they were delivered or given up, so they survive
+restarts.
+
+Configuration (environment):
+    SIMOD_HTTP_CALLBACK_CONCURRENCY  callbacks delivered at the same time (default 8)
+    SIMOD_HTTP_CALLBACK_ATTEMPTS     attempts before a callback is given up (default 8)
+    SIMOD_HTTP_CALLBACK_TIMEOUT      seconds an attempt may take (default 10)
+    SIMOD_HTTP_CALLBACK_BACKOFF      seconds before the first retry, doubled for every further one (default 2)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import anyio
+import httpx
+
+from simod_http.app import Settings
+
+OUTBOX_DIR = 'outbox'
+POLL_INTERVAL = 1.0
+MAX_BACKOFF = 600
+# Client errors other than these will not go away by retrying
+RETRY_STATUS_CODES = [408, 425, 429]
+
+
+class CallbackDispatcher:
+    def __init__(self, outbox_dir: Path, concurrency: int = 8, max_attempts: int = 8, timeout: float = 10.0,
+                 backoff: float = 2.0):
+        self.outbox_dir = Path(outbox_dir)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._in_flight = set()
+        self._deliveries = set()
+
+    @classmethod
+    def from_env(cls, settings: Settings) -> 'CallbackDispatcher':
+        return cls(
+            outbox_dir=Path(settings.simod_http_storage_path) / OUTBOX_DIR,
+            concurrency=int(os.environ.get('SIMOD_HTTP_CALLBACK_CONCURRENCY', 8)),
+            max_attempts=int(os.environ.get('SIMOD_HTTP_CALLBACK_ATTEMPTS', 8)),
+            timeout=float(os.environ.get('SIMOD_HTTP_CALLBACK_TIMEOUT', 10)),
+            backoff=float(os.environ.get('SIMOD_HTTP_CALLBACK_BACKOFF', 2)),
+        )
+
+    def enqueue(self, callback_url: str, payload: dict):
+        """
+        Adds a notification to the outbox. Safe to call from any thread or process.
+        """
+        notification_id = uuid.uuid4().hex
+        self._write(notification_id, {
+            'id': notification_id,
+            'callback_url': callback_url,
+            'payload': payload,
+            'attempts': 0,
+            'next_attempt': time.time(),
+        })
+        # Processes without a running dispatcher leave the delivery to the next poll
+        if self._loop is not None and self._loop.is_running() and os.getpid() == self._pid:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._pid = os.getpid()
+        self._wakeup = asyncio.Event()
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the dispatcher, undelivered notifications are sent after the next start.
+        """
+        tasks = [task for task in [self._task, *self._deliveries] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+        self._loop = None
+
+    def _write(self, notification_id: str, notification: dict):
+        self.outbox_dir.mkdir(parents=True, exist_ok=True)
+        path = self.outbox_dir / f'{notification_id}.json'
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(notification))
+        os.replace(tmp_path, path)
+
+    def _due(self) -> list:
+        if not self.outbox_dir.exists():
+            return []
+
+        now = time.time()
+        due = []
+        for path in self.outbox_dir.glob('*.json'):
+            if path.stem in self._in_flight:
+                continue
+            try:
+                notification = json.loads(path.read_text())
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if notification['next_attempt'] <= now:
+                due.append(notification)
+        return due
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            try:
+                for notification in await anyio.to_thread.run_sync(self._due):
+                    self._in_flight.add(notification['id'])
+                    delivery = asyncio.create_task(self._deliver(notification, semaphore))
+                    self._deliveries.add(delivery)
+                    delivery.add_done_callback(self._deliveries.discard)
+            except Exception as e:
+                logging.error(f'Callback dispatcher error: {str(e)}')
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver(self, notification: dict, semaphore: asyncio.Semaphore):
+        try:
+            async with semaphore:
+                error = await self._post(notification)
+
+            path = self.outbox_dir / f'{notification["id"]}.json'
+            notification['attempts'] += 1
+            if error is None:
+                await anyio.to_thread.run_sync(lambda: path.unlink(missing_ok=True))
+                return
+
+            retry = error[1] and notification['attempts'] < self.max_attempts
+            if not retry:
+                logging.error(f'Giving up callback to {notification["callback_url"]} after '
+                              f'{notification["attempts"]} attempts: {error[0]}')
+                await anyio.to_thread.run_sync(lambda: path.unlink(missing_ok=True))
+                return
+
+            delay = min(self.backoff * 2 ** (notification['attempts'] - 1), MAX_BACKOFF)
+            logging.warning(f'Callback to {notification["callback_url"]} failed, retrying in {delay:.1f}s: {error[0]}')
+            notification['next_attempt'] = time.time() + delay
+            await anyio.to_thread.run_sync(self._write, notification['id'], notification)
+        finally:
+            self._in_flight.discard(notification['id'])
+
+    async def _post(self, notification: dict) -> Optional[tuple]:
+        """
+        Sends the notification once. Returns None on success, otherwise (error message, retry).
+        """
+        try:
+            response = await self._client.post(notification['callback_url'], json=notification['payload'])
+        except httpx.HTTPError as e:
+            return f'{type(e).__name__}: {str(e)}', True
+
+        if response.is_success:
+            return None
+        retry = response.status_code >= 500 or response.status_code in RETRY_STATUS_CODES
+        return f'HTTP {response.status_code}', retry
@@ -0,0 +1,160 @@
+"""
+Index of the discovery requests in the requests/ storage.
+
+A SQLite database next to the request directories (`requests.sqlite`) keeps
+the id, status, timestamp and expiry of every request, so the periodic clean
+up and the shutdown hook query the index instead of loading the request.json
+of every directory. The statuses are also cached in memory for the status
+polls. The index is updated whenever the service saves a request; discovery
+processes write their final status to the database, which the scheduler
+reads back into the cache when the process exits.
+
+Walking the request directories is only needed to rebuild the index, e.g.
+for requests stored before the index existed.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from simod_http.app import Request as AppRequest, RequestStatus, Settings
+
+INDEX_FILE = 'requests.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS requests (
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    timestamp REAL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS requests_expires_at ON requests (expires_at);
+CREATE INDEX IF NOT EXISTS requests_status ON requests (status);
+'''
+
+
+class RequestIndex:
+    def __init__(self, path: Path, expiration: float):
+        self.path = Path(path)
+        self.expiration = expiration
+        self._statuses = dict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> 'RequestIndex':
+        storage_path = Path(settings.simod_http_storage_path)
+        return cls(storage_path / INDEX_FILE, settings.simod_http_request_expiration_timedelta)
+
+    def _after_fork(self):
+        # A lock held by another thread of the parent would never be released in a discovery process
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters=()) -> list:
+        with self._lock:
+            # A forked discovery process must not share the connection of its parent
+            if self._connection is None or self._pid != os.getpid():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.executescript(_SCHEMA)
+                self._pid = os.getpid()
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def record(self, request: AppRequest):
+        """
+        Adds or updates the entry of a saved request.
+        """
+        status = request.status.value if request.status is not None else None
+        timestamp = request.timestamp.timestamp() if request.timestamp is not None else None
+        expires_at = timestamp + self.expiration if timestamp is not None else None
+        self._execute(
+            'INSERT INTO requests (id, status, timestamp, expires_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET status = excluded.status, timestamp = excluded.timestamp, '
+            'expires_at = excluded.expires_at',
+            (request.id, status, timestamp, expires_at),
+        )
+        self._statuses[request.id] = request.status
+
+    def set_status(self, request_id: str, status: RequestStatus):
+        self._execute('UPDATE requests SET status = ? WHERE id = ?', (status.value, request_id))
+        self._statuses[request_id] = status
+
+    def status(self, request_id: str) -> Optional[RequestStatus]:
+        """
+        Status of the request, from the cache if possible. None for requests that are not indexed.
+        """
+        if request_id in self._statuses:
+            return self._statuses[request_id]
+        return self.refresh(request_id)
+
+    def refresh(self, request_id: str) -> Optional[RequestStatus]:
+        """
+        Reads the status of the request from the database, e.g. after another process updated it.
+        """
+        rows = self._execute('SELECT status FROM requests WHERE id = ?', (request_id,))
+        if not rows:
+            self._statuses.pop(request_id, None)
+            return None
+        status = RequestStatus(rows[0][0]) if rows[0][0] is not None else RequestStatus.UNKNOWN
+        self._statuses[request_id] = status
+        return status
+
+    def expired(self, now: pd.Timestamp) -> List[str]:
+        """
+        Ids of the requests that expired at `now` and of those without timestamp that are neither running nor
+        accepted, i.e. waiting in the queue of the scheduler.
+        """
+        rows = self._execute(
+            'SELECT id FROM requests WHERE expires_at <= ? '
+            'OR (timestamp IS NULL AND coalesce(status, \'\') NOT IN (?, ?))',
+            (now.timestamp(), RequestStatus.RUNNING.value, RequestStatus.ACCEPTED.value),
+        )
+        return [row[0] for row in rows]
+
+    def unfinished(self) -> List[str]:
+        """
+        Ids of the requests that neither succeeded nor failed.
+        """
+        rows = self._execute(
+            'SELECT id FROM requests WHERE coalesce(status, \'\') NOT IN (?, ?)',
+            (RequestStatus.SUCCESS.value, RequestStatus.FAILURE.value),
+        )
+        return [row[0] for row in rows]
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self._execute('SELECT id FROM requests')]
+
+    def remove(self, request_id: str):
+        self._execute('DELETE FROM requests WHERE id = ?', (request_id,))
+        self._statuses.pop(request_id, None)
+
+    def rebuild(self, requests_dir: Path, settings: Settings):
+        """
+        Indexes the request directories that are not indexed yet and drops the entries of removed directories.
+        """
+        indexed = set(self.ids())
+        stored = set()
+        if requests_dir.exists():
+            for request_dir in requests_dir.iterdir():
+                if not (request_dir / 'request.json').exists():
+                    continue
+                stored.add(request_dir.name)
+                if request_dir.name in indexed:
+                    continue
+                try:
+                    self.record(AppRequest.load(request_dir.name, settings))
+                except Exception as e:
+                    logging.error(f'Failed to index request: {request_dir.name}, {str(e)}')
+
+        for request_id in indexed - stored:
+            self.remove(request_id)
+        logging.info(f'Request index: {len(stored)} requests, {len(stored - indexed)} newly indexed, '
+                     f'{len(indexed - stored)} removed')
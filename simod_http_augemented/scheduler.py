@@ -0,0 +1,217 @@
+"""
+Bounded scheduler of the Simod discoveries.
+
+Every discovery runs in a process of its own, at most SIMOD_HTTP_WORKERS at a
+time. Further discoveries wait in a priority queue (higher priority first,
+FIFO among equal priorities) that is kept in the requests/ storage: a
+`queue.json` marker in the request directory holds the priority and the time
+the request was queued, so queued requests are picked up again after a
+restart. When a `RequestIndex` is given, it is told about the requests that
+start and reads the status of the finished ones back. `notify(request)` is
+called for requests whose discovery process died without recording a result.
+
+Configuration (environment):
+    SIMOD_HTTP_WORKERS           discoveries running at the same time (default 1)
+    SIMOD_HTTP_JOB_CPU_LIMIT     CPU seconds a discovery process may use, 0 disables (default 0)
+    SIMOD_HTTP_JOB_MEMORY_LIMIT  bytes of address space a discovery process may use, 0 disables (default 0)
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+
+from simod_http.app import Request as AppRequest, RequestStatus, Settings
+
+QUEUE_FILE = 'queue.json'
+POLL_INTERVAL = 0.5
+
+
+def _run_discovery(run: Callable, request: Optional[AppRequest], request_id: str, settings: Settings,
+                   cpu_limit: int, memory_limit: int):
+    if cpu_limit > 0:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, resource.RLIM_INFINITY))
+    if memory_limit > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, resource.RLIM_INFINITY))
+
+    # Requests recovered after a restart are not in memory anymore
+    if request is None:
+        request = AppRequest.load(request_id, settings)
+    run(request, settings)
+
+
+class DiscoveryScheduler:
+    def __init__(self, settings: Settings, run: Callable, workers: int = 1, cpu_limit: int = 0, memory_limit: int = 0,
+                 index=None, notify: Optional[Callable] = None):
+        self.settings = settings
+        self.run = run
+        self.index = index
+        self.notify = notify
+        self.workers = workers
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self._queue = []
+        self._requests = dict()
+        self._running = dict()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._stopped = False
+
+        # Forked children inherit the request of the submission, nothing has to be pickled
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('fork')
+        else:
+            self._context = multiprocessing.get_context()
+
+    @classmethod
+    def from_env(cls, settings: Settings, run: Callable, index=None,
+                 notify: Optional[Callable] = None) -> 'DiscoveryScheduler':
+        return cls(
+            settings=settings,
+            run=run,
+            index=index,
+            notify=notify,
+            workers=int(os.environ.get('SIMOD_HTTP_WORKERS', 1)),
+            cpu_limit=int(os.environ.get('SIMOD_HTTP_JOB_CPU_LIMIT', 0)),
+            memory_limit=int(os.environ.get('SIMOD_HTTP_JOB_MEMORY_LIMIT', 0)),
+        )
+
+    @property
+    def requests_dir(self) -> Path:
+        return Path(self.settings.simod_http_storage_path) / 'requests'
+
+    def submit(self, request: AppRequest, priority: int = 0):
+        """
+        Queues the discovery of `request`, which must have been saved as accepted.
+        """
+        enqueued = time.time()
+        (request.output_dir / QUEUE_FILE).write_text(json.dumps({'priority': priority, 'enqueued': enqueued}))
+        with self._lock:
+            heapq.heappush(self._queue, (-priority, enqueued, next(self._sequence), request.id))
+            self._requests[request.id] = request
+            self._ensure_dispatcher()
+
+    def recover(self):
+        """
+        Queues the accepted requests of the storage again, e.g. after a restart.
+        """
+        if not self.requests_dir.exists():
+            return
+
+        recovered = []
+        for queue_path in self.requests_dir.glob(f'*/{QUEUE_FILE}'):
+            request_id = queue_path.parent.name
+            try:
+                entry = json.loads(queue_path.read_text())
+                request = AppRequest.load(request_id, self.settings)
+            except Exception as e:
+                logging.error(f'Failed to recover queued request: {request_id}, {str(e)}')
+                continue
+            if request.status != RequestStatus.ACCEPTED:
+                queue_path.unlink(missing_ok=True)
+                continue
+            recovered.append((-entry['priority'], entry['enqueued'], request_id))
+
+        with self._lock:
+            for priority, enqueued, request_id in recovered:
+                heapq.heappush(self._queue, (priority, enqueued, next(self._sequence), request_id))
+            if self._queue:
+                logging.info(f'Recovered {len(recovered)} queued requests')
+                self._ensure_dispatcher()
+
+    def queue_position(self, request_id: str) -> Optional[int]:
+        """
+        1-based position of the request in the queue, None if it is not queued.
+        """
+        with self._lock:
+            for position, entry in enumerate(sorted(self._queue)):
+                if entry[3] == request_id:
+                    return position + 1
+        return None
+
+    def shutdown(self):
+        """
+        Stops the dispatcher and terminates the running discoveries. Queued requests stay in the storage.
+        """
+        with self._lock:
+            self._stopped = True
+            running = list(self._running.values())
+        for process in running:
+            process.terminate()
+        for process in running:
+            process.join()
+        with self._lock:
+            self._running.clear()
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name='discovery-dispatcher', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while not self._stopped:
+            try:
+                self._reap()
+                self._start_queued()
+            except Exception as e:
+                logging.error(f'Discovery dispatcher error: {str(e)}')
+            time.sleep(POLL_INTERVAL)
+
+    def _reap(self):
+        with self._lock:
+            finished = [(request_id, process) for request_id, process in self._running.items() if not process.is_alive()]
+            for request_id, _ in finished:
+                del self._running[request_id]
+
+        for request_id, process in finished:
+            process.join()
+            if process.exitcode == 0:
+                if self.index is not None:
+                    self.index.refresh(request_id)
+                continue
+            # Killed by a resource limit or crashed before Simod could record the failure
+            logging.error(f'Discovery process of request {request_id} exited with code {process.exitcode}')
+            try:
+                request = AppRequest.load(request_id, self.settings)
+            except Exception:
+                continue
+            if request.status not in [RequestStatus.SUCCESS, RequestStatus.FAILURE]:
+                request.status = RequestStatus.FAILURE
+                request.timestamp = pd.Timestamp.now()
+                request.save()
+                if self.notify is not None:
+                    self.notify(request)
+            if self.index is not None:
+                self.index.record(request)
+
+    def _start_queued(self):
+        with self._lock:
+            while not self._stopped and len(self._running) < self.workers and self._queue:
+                *_, request_id = heapq.heappop(self._queue)
+                request = self._requests.pop(request_id, None)
+                request_dir = self.requests_dir / request_id
+                if not request_dir.exists():
+                    # Removed from the storage while it was waiting
+                    continue
+                (request_dir / QUEUE_FILE).unlink(missing_ok=True)
+                if self.index is not None:
+                    self.index.set_status(request_id, RequestStatus.RUNNING)
+
+                # Not a daemon, Simod starts processes of its own
+                process = self._context.Process(
+                    target=_run_discovery,
+                    args=(self.run, request, request_id, self.settings, self.cpu_limit, self.memory_limit),
+                    name=f'discovery-{request_id}',
+                )
+                process.start()
+                self._running[request_id] = process
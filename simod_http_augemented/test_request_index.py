@@ -0,0 +1,40 @@
+"""
+Tests of the request index that the clean up queries.
+
+Run inside the simod-http image, with the modules of this directory copied
+into simod_http as in the Dockerfile:
+    python -m pytest -q src/simod_http/test_request_index.py
+"""
+
+from types import SimpleNamespace
+
+import pandas as pd
+
+from simod_http.app import RequestStatus
+from simod_http.request_index import RequestIndex
+
+
+def indexed(index, request_id, status, timestamp=None):
+    index.record(SimpleNamespace(id=request_id, status=status, timestamp=timestamp))
+
+
+def test_queued_request_survives_clean_up(tmp_path):
+    index = RequestIndex(tmp_path / 'requests.sqlite', expiration=60)
+    now = pd.Timestamp.now()
+    indexed(index, 'queued', RequestStatus.ACCEPTED)
+    indexed(index, 'running', RequestStatus.RUNNING)
+    indexed(index, 'unusable', RequestStatus.UNKNOWN)
+    indexed(index, 'expired', RequestStatus.SUCCESS, now - pd.Timedelta(seconds=120))
+    indexed(index, 'recent', RequestStatus.FAILURE, now)
+
+    assert sorted(index.expired(now)) == ['expired', 'unusable']
+
+
+def test_finished_request_expires_after_it_left_the_queue(tmp_path):
+    index = RequestIndex(tmp_path / 'requests.sqlite', expiration=60)
+    now = pd.Timestamp.now()
+    indexed(index, 'queued', RequestStatus.ACCEPTED)
+    assert index.expired(now + pd.Timedelta(days=1)) == []
+
+    indexed(index, 'queued', RequestStatus.SUCCESS, now)
+    assert index.expired(now + pd.Timedelta(seconds=61)) == ['queued']